@@ -2,7 +2,7 @@ import random
 import threading
 import time
 from typing import Any, List
-from labrpc.labrpc import ClientEnd
+from labrpc.labrpc import ClientEnd, OverloadError
 from server import GetArgs, GetReply, PutAppendArgs, PutAppendReply
 
 def nrand() -> int:
@@ -42,6 +42,14 @@ class Clerk:
             servers.append(server_id)
         return servers
 
+    def _backoff(self, delay, overloaded):
+        """Pause before retrying; back off exponentially while servers shed load"""
+        if not overloaded:
+            time.sleep(0.001)
+            return 0.001
+        time.sleep(random.uniform(0, delay))
+        return min(delay * 2, 0.1)
+
     def get(self, key: str) -> str:
         """Fetch the current value for a key. Returns \"\" if the key does not exist."""
         seq = self._next_seq()
@@ -53,17 +61,21 @@ class Clerk:
         servers = self._servers_for_shard(shard)
 
         # Keep trying until we get a successful response
+        delay = 0.001
         while True:
+            overloaded = False
             for server_idx in servers:
                 try:
                     reply = self.servers[server_idx].call("KVServer.Get", args)
                     if reply is not None and hasattr(reply, "value"):
                         return reply.value if reply.value is not None else ""
+                except OverloadError:
+                    overloaded = True
                 except (TimeoutError, Exception):
                     continue
             
             # Brief pause before retrying all servers
-            time.sleep(0.001)
+            delay = self._backoff(delay, overloaded)
 
     def put_append(self, key: str, value: str, op: str) -> str:
         """Shared implementation for Put and Append operations"""
@@ -77,7 +89,9 @@ class Clerk:
         servers = self._servers_for_shard(shard)
 
         # Keep trying until we get a successful response
+        delay = 0.001
         while True:
+            overloaded = False
             for server_idx in servers:
                 try:
                     if op == "Put":
@@ -87,11 +101,13 @@ class Clerk:
                     
                     if reply is not None and hasattr(reply, "value"):
                         return reply.value if reply.value is not None else ""
+                except OverloadError:
+                    overloaded = True
                 except (TimeoutError, Exception):
                     continue
             
             # Brief pause before retrying all servers
-            time.sleep(0.001)
+            delay = self._backoff(delay, overloaded)
 
     def put(self, key: str, value: str):
         """Install or replace the value for a particular key"""
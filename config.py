@@ -8,6 +8,7 @@ import logging
 import base64
 
 from labrpc.labrpc import Network, Service, Server
+from labgob import labgob
 from client import Clerk
 from server import KVServer
 
@@ -21,11 +22,27 @@ def make_seed():
     bigx = random.randint(0, max_val)
     return bigx
 
+# t is the test to report to; tools that only want a running cluster,
+# like kv_bench, can leave it out.
 class Config:
-    def __init__(self, t: unittest.TestCase):
+    def __init__(self, t: unittest.TestCase = None):
         self.mu = threading.Lock()
         self.t = t
+        # LABRPC_SEED=<n> runs the network in virtual time, so a failing
+        # schedule of delays, drops and reorderings can be replayed. Only
+        # the network is simulated: tests that run their clients for a
+        # wall-clock period, like generic_test, still take as long and
+        # issue as many ops as the machine's thread scheduling allows.
+        self.seed = None
+        seed = os.environ.get("LABRPC_SEED")
+        if seed:
+            try:
+                self.seed = int(seed)
+            except ValueError:
+                raise ValueError(f"LABRPC_SEED={seed!r}: expecting an integer seed") from None
         self.net = Network()
+        if os.environ.get("LABRPC_STATS"):
+            self.net.enable_stats()
         self.nservers = 0
         self.kvservers = None
         self.running_servers = set()
@@ -35,6 +52,11 @@ class Config:
         self.rpcs0 = 0
         self.ops = 0
         self.nreplicas = 1
+        # KVServers keep values of at least this many bytes compressed
+        self.compress_values = int(os.environ.get("KV_COMPRESS_VALUES", "0"))
+        self.rand = random.Random(self.seed)
+        if self.seed is not None:
+            self.net.simulate(self.seed)
 
     def cleanup(self):
         with self.mu:
@@ -42,7 +64,7 @@ class Config:
 
     def make_client(self):
         with self.mu:
-            endnames = [randstring(20) for i in range(self.nservers)]
+            endnames = [self.endname() for i in range(self.nservers)]
             ends = [self.net.make_end(endname) for endname in endnames]
             for srvid in range(self.nservers):
                 self.net.connect(endnames[srvid], srvid)
@@ -51,6 +73,12 @@ class Config:
             self.connect_client_unlocked(ck)
         return ck
 
+    def endname(self):
+        if self.seed is None:
+            return randstring(20)
+        # deterministic names, so each end sees the same fault schedule
+        return "".join(self.rand.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(20))
+
     def delete_client(self, ck):
         with self.mu:
             for v in self.clerks[ck]:
@@ -99,6 +127,8 @@ class Config:
 
     def begin(self, description):
         print(f"{description} ...\n")
+        if self.seed is not None:
+            print(f"  (virtual time, LABRPC_SEED={self.seed})\n")
         self.t0 = time.time()
         self.rpcs0 = self.rpc_total()
         with self.mu:
@@ -111,14 +141,32 @@ class Config:
     def rpc_total(self):
         return self.net.get_total_count()
 
+    # at-rest value compression summed over the KVServers, in the form of
+    # Compressor.stats()
+    def store_stats(self) -> dict:
+        total = {"count": 0, "raw_bytes": 0, "compressed_bytes": 0, "compress_secs": 0.0, "decompress_secs": 0.0}
+        for kv in self.kvservers or []:
+            for k, v in kv.store.stats().items():
+                if k in total:
+                    total[k] += v
+        total["ratio"] = total["raw_bytes"] / total["compressed_bytes"] if total["compressed_bytes"] else 1.0
+        return total
+
     def end(self):
-        if self.t.defaultTestResult().wasSuccessful():
+        if self.t is not None and self.t.defaultTestResult().wasSuccessful():
             t = time.time() - self.t0
             nrpc = self.rpc_total() - self.rpcs0
             with self.mu:
                 ops = self.ops
             print("  ... Passed --")
             print(f" t {t} nrpc {nrpc} ops {ops}\n")
+            if os.environ.get("LABRPC_STATS"):
+                print(self.net.stats.report() + "\n")
+                if labgob.compressor.threshold:
+                    print(f" compression {labgob.compression_stats()}\n")
+            # every Append decompresses and recompresses the whole value
+            if self.compress_values:
+                print(f" value compression {self.store_stats()}\n")
 
 def make_single_config(t, unreliable):
     cfg = Config(t)
@@ -129,6 +177,10 @@ def make_single_config(t, unreliable):
     return cfg
 
 def make_shard_config(t, nshards, nreplicas, unreliable):
+    return make_cluster(nshards, nreplicas, unreliable, t)
+
+# nshards shards of nreplicas servers each, started and ready for clients
+def make_cluster(nshards, nreplicas=1, unreliable=False, t: unittest.TestCase = None) -> Config:
     cfg = Config(t)
     cfg.clerks = {}
     cfg.start = time.time()
@@ -0,0 +1,410 @@
+import argparse
+import base64
+import contextlib
+import json
+import math
+import queue
+import random
+import sys
+import threading
+import time
+
+from config import make_cluster
+from labrpc.lanes import size_class
+
+# A YCSB-style load generator for the KV store. Run from the repository
+# root:
+#
+#   python -m kv_bench                                  # workload a
+#   python -m kv_bench --workload b --dist hotspot --clients 16
+#   python -m kv_bench --read 0.5 --append 0.5 --rate 2000 --json out.json
+#
+# Each run starts a cluster with config.make_cluster, puts a first value
+# in every key, then has --clients clients issue operations for
+# --duration seconds. Closed-loop clients issue their next op as soon as
+# the last one returns. With --rate, clients are open-loop: together they
+# start ops at that many per second, as a Poisson process, each with up to
+# --outstanding ops in flight at once, whether or not earlier ops have
+# returned. Latency is measured from when an op was due to start, so a
+# stalled server is not hidden by clients that stop asking.
+#
+# Keys are "0".."keys-1"; client randomness comes from --seed, so runs
+# against the same server code issue the same operations.
+#
+# --max-active and --max-waiting bound each server's concurrent requests
+# (labrpc.Server.set_limits), and --lanes THRESHOLD puts requests larger
+# than THRESHOLD bytes in the bulk lane (labrpc.lanes.size_class), so
+# small Gets overtake large Puts and Appends waiting for a slot. To see
+# what lanes buy a mixed workload, compare Get p99 between two runs:
+#
+#   python -m kv_bench --workload a --value-size 65536 --max-active 1
+#   python -m kv_bench --workload a --value-size 65536 --max-active 1 --lanes 4096
+
+# YCSB's core workloads, as far as this store can run them. There are no
+# scans (E) or inserts (D), and F's read-modify-write is an append.
+WORKLOADS = {
+    "a": dict(read=0.5, put=0.5, append=0.0, dist="zipfian"),  # update heavy
+    "b": dict(read=0.95, put=0.05, append=0.0, dist="zipfian"),  # read mostly
+    "c": dict(read=1.0, put=0.0, append=0.0, dist="zipfian"),  # read only
+    "f": dict(read=0.5, put=0.0, append=0.5, dist="zipfian"),  # read-modify-write
+}
+
+OPS = ("get", "put", "append")
+PERCENTILES = (50, 95, 99, 99.9)
+
+# Zipfian keys, hottest first, as in YCSB's ZipfianGenerator (Gray et
+# al., "Quickly generating billion-record synthetic databases").
+class Zipfian:
+    def __init__(self, n, theta=0.99):
+        self.n = n
+        self.theta = theta
+        self.zetan = sum(1 / i ** theta for i in range(1, n + 1))
+        zeta2 = 1 + 0.5 ** theta
+        self.alpha = 1 / (1 - theta)
+        # with two keys or fewer, next() never gets past the first two
+        # branches, and zeta2 == zetan would make eta divide by zero
+        self.eta = (1 - (2 / n) ** (1 - theta)) / (1 - zeta2 / self.zetan) if n > 2 else 0
+        self.half = zeta2
+
+    def next(self, rng):
+        u = rng.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < self.half:
+            return 1
+        return min(self.n - 1, int(self.n * (self.eta * u - self.eta + 1) ** self.alpha))
+
+class Uniform:
+    def __init__(self, n):
+        self.n = n
+
+    def next(self, rng):
+        return rng.randrange(self.n)
+
+# hot_ops of the ops go to the first hot_keys of the keys
+class Hotspot:
+    def __init__(self, n, hot_keys=0.2, hot_ops=0.8):
+        self.n = n
+        self.hot = max(1, int(n * hot_keys))
+        self.hot_ops = hot_ops
+
+    def next(self, rng):
+        if rng.random() < self.hot_ops or self.hot == self.n:
+            return rng.randrange(self.hot)
+        return rng.randrange(self.hot, self.n)
+
+DISTRIBUTIONS = {
+    "uniform": Uniform,
+    "zipfian": Zipfian,
+    "hotspot": Hotspot,
+}
+
+# value sizes: fixed, uniform over 1..2*size, or exponential with mean size
+VALUE_DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+class Workload:
+    def __init__(self, read=0.5, put=0.5, append=0.0, keys=1000, dist="zipfian",
+                 value_size=100, value_dist="fixed", seed=0):
+        total = read + put + append
+        if total <= 0:
+            raise ValueError("kv_bench: workload has no operations")
+        if dist not in DISTRIBUTIONS:
+            raise ValueError(f"kv_bench: unknown key distribution {dist!r}")
+        if value_dist not in VALUE_DISTRIBUTIONS:
+            raise ValueError(f"kv_bench: unknown value size distribution {value_dist!r}")
+        self.read = read / total
+        self.put = put / total
+        self.append = append / total
+        self.keys = keys
+        self.dist = dist
+        self.value_size = value_size
+        self.value_dist = value_dist
+        self.seed = seed
+        self.chooser = DISTRIBUTIONS[dist](keys)
+        self.max_size = value_size if value_dist == "fixed" else 8 * value_size
+        # values are slices of one random string, so making one is cheap
+        rng = random.Random(seed)
+        self.blob = base64.urlsafe_b64encode(rng.randbytes(2 * self.max_size)).decode()
+
+    def key(self, rng) -> str:
+        return str(self.chooser.next(rng))
+
+    def value(self, rng) -> str:
+        n = self.value_size
+        if self.value_dist == "uniform":
+            n = rng.randint(1, 2 * n)
+        elif self.value_dist == "exponential":
+            n = min(self.max_size, max(1, int(rng.expovariate(1 / n))))
+        off = rng.randrange(len(self.blob) - n + 1)
+        return self.blob[off:off + n]
+
+    def op(self, rng) -> str:
+        r = rng.random()
+        if r < self.read:
+            return "get"
+        if r < self.read + self.put:
+            return "put"
+        return "append"
+
+    def config(self) -> dict:
+        return {
+            "read": self.read,
+            "put": self.put,
+            "append": self.append,
+            "keys": self.keys,
+            "dist": self.dist,
+            "value_size": self.value_size,
+            "value_dist": self.value_dist,
+            "seed": self.seed,
+        }
+
+# nearest-rank percentile of sorted xs, like labrpc's Histogram
+def percentile(xs, p):
+    if not xs:
+        return 0.0
+    return xs[max(0, math.ceil(len(xs) * p / 100) - 1)]
+
+def summarize(latencies) -> dict:
+    xs = sorted(latencies)
+    row = {"count": len(xs), "mean_ms": sum(xs) / len(xs) * 1e3 if xs else 0.0}
+    for p in PERCENTILES:
+        row[f"p{p:g}_ms"] = percentile(xs, p) * 1e3
+    row["max_ms"] = xs[-1] * 1e3 if xs else 0.0
+    return row
+
+class ClientResult:
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.latencies = {op: [] for op in OPS}  # seconds, after warmup
+        self.late = 0  # open loop: measured ops that waited for a free clerk
+        self.dropped = 0  # open loop: ops still waiting when the run ended
+
+def issue(ck, w: Workload, op: str, key: str, value: str):
+    if op == "get":
+        ck.get(key)
+    elif op == "put":
+        ck.put(key, value)
+    else:
+        ck.append(key, value)
+
+def run_client(cfg, w: Workload, cli: int, start: float, warmup: float, duration: float, rate: float,
+               outstanding: int, res: ClientResult):
+    rng = random.Random(w.seed * 1000003 + cli + 1)
+    if rate:
+        open_loop(cfg, w, rng, start, warmup, duration, rate, outstanding, res)
+        return
+    ck = cfg.make_client()
+    measure_from = start + warmup
+    stop = start + warmup + duration
+    try:
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= stop:
+                return
+            op = w.op(rng)
+            key = w.key(rng)
+            issue(ck, w, op, key, w.value(rng) if op != "get" else None)
+            cfg.op()
+            if t0 >= measure_from:
+                res.latencies[op].append(time.perf_counter() - t0)
+    finally:
+        cfg.delete_client(ck)
+
+# One thread schedules the client's ops as a Poisson process and hands
+# each, when due, to the first of outstanding clerks that is free, so ops
+# overlap and the offered load holds while the servers are slow. Latency
+# runs from when an op was due; if every clerk is busy, an op waits, and
+# that wait counts. Ops still waiting at the end of the run are dropped,
+# rather than run on working through the backlog.
+def open_loop(cfg, w: Workload, rng, start, warmup, duration, rate, outstanding, res: ClientResult):
+    measure_from = start + warmup
+    stop = start + warmup + duration
+    todo = queue.Queue()
+
+    def worker():
+        ck = cfg.make_client()
+        try:
+            while True:
+                item = todo.get()
+                if item is None:
+                    return
+                due, op, key, value = item
+                now = time.perf_counter()
+                if now >= stop:
+                    with res.mu:
+                        res.dropped += 1
+                    continue
+                if now - due > 1 / rate and now >= measure_from:
+                    with res.mu:
+                        res.late += 1
+                issue(ck, w, op, key, value)
+                cfg.op()
+                # measured by when it ran, timed from when it was due
+                if now >= measure_from:
+                    res.latencies[op].append(time.perf_counter() - due)
+        finally:
+            cfg.delete_client(ck)
+
+    workers = [threading.Thread(target=worker) for _ in range(outstanding)]
+    for th in workers:
+        th.start()
+    due = start
+    while True:
+        due += rng.expovariate(rate)
+        if due >= stop:
+            break
+        op = w.op(rng)
+        key = w.key(rng)
+        value = w.value(rng) if op != "get" else None
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+        todo.put((due, op, key, value))
+    for _ in workers:
+        todo.put(None)
+    for th in workers:
+        th.join()
+
+def load(cfg, w: Workload, nclients: int):
+    def loader(cli):
+        rng = random.Random(w.seed - cli - 1)
+        ck = cfg.make_client()
+        for k in range(cli, w.keys, nclients):
+            ck.put(str(k), w.value(rng))
+        cfg.delete_client(ck)
+    threads = [threading.Thread(target=loader, args=(cli,)) for cli in range(nclients)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+# Runs w against a fresh cluster and returns the results as a flat,
+# JSON-ready dict. rate is the total open-loop rate in ops per second;
+# 0 means closed-loop clients.
+# lanes is the size_class threshold in bytes, None for a single lane;
+# max_active and max_waiting are passed to every server's set_limits.
+def run_workload(w: Workload, nclients=8, duration=5.0, warmup=1.0, rate=0.0,
+                 nshards=1, nreplicas=1, unreliable=False,
+                 lanes=None, max_active=None, max_waiting=None, outstanding=4) -> dict:
+    cfg = make_cluster(nshards, nreplicas, unreliable)
+    try:
+        if lanes is not None:
+            cfg.net.set_lanes(size_class(lanes))
+        if max_active is not None or max_waiting is not None:
+            for srv in cfg.net.servers.values():
+                srv.set_limits(max_active, max_waiting)
+        load(cfg, w, nclients)
+        results = [ClientResult() for _ in range(nclients)]
+        start = time.perf_counter() + 0.05  # give every client time to start
+        rpcs0 = cfg.rpc_total()
+        bytes0 = cfg.net.get_total_bytes()
+        threads = [threading.Thread(target=run_client, args=(cfg, w, cli, start, warmup, duration, rate / nclients, outstanding, results[cli]))
+                   for cli in range(nclients)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        elapsed = time.perf_counter() - start - warmup
+        nrpc = cfg.rpc_total() - rpcs0
+        nbytes = cfg.net.get_total_bytes() - bytes0
+        with cfg.mu:
+            issued = cfg.ops
+    finally:
+        cfg.cleanup()
+
+    latency = {op: [x for r in results for x in r.latencies[op]] for op in OPS}
+    every = [x for op in OPS for x in latency[op]]
+    return {
+        "workload": w.config(),
+        "clients": nclients,
+        "loop": "open" if rate else "closed",
+        "rate": rate,
+        "outstanding": outstanding if rate else 1,
+        "shards": nshards,
+        "replicas": nreplicas,
+        "unreliable": unreliable,
+        "lanes": lanes,
+        "max_active": max_active,
+        "max_waiting": max_waiting,
+        "duration": duration,
+        "warmup": warmup,
+        "ops": len(every),
+        "seconds": elapsed,
+        "throughput": len(every) / elapsed if elapsed > 0 else 0.0,
+        "issued": issued,  # ops, counting warmup, that nrpc and bytes are for
+        "nrpc": nrpc,
+        "bytes": nbytes,
+        "late": sum(r.late for r in results),
+        "dropped": sum(r.dropped for r in results),
+        "latency": dict({"all": summarize(every)}, **{op: summarize(latency[op]) for op in OPS if latency[op]}),
+    }
+
+def print_result(r, out=sys.stdout):
+    w = r["workload"]
+    clients = f"{r['clients']} clients" + (f" x {r['outstanding']} outstanding" if r["loop"] == "open" else "")
+    print(f"{r['loop']}-loop, {clients}, {r['shards']} shards x {r['replicas']} replicas"
+          f"{', unreliable' if r['unreliable'] else ''}; read {w['read']:.2f} put {w['put']:.2f} append {w['append']:.2f}, "
+          f"{w['keys']} {w['dist']} keys, {w['value_dist']} {w['value_size']}-byte values", file=out)
+    limits = [f"{k.replace('_', ' ')} {r[k]}" for k in ("max_active", "max_waiting") if r.get(k) is not None]
+    if r.get("lanes") is not None:
+        limits.append(f"bulk lane over {r['lanes']} bytes")
+    if limits:
+        print(f"  {', '.join(limits)}", file=out)
+    print(f"  {r['ops']} ops in {r['seconds']:.2f}s: {r['throughput']:.0f} ops/s, {r['nrpc']} rpcs, {r['bytes']} bytes"
+          + (f", {r['late']} late, {r['dropped']} dropped" if r["loop"] == "open" else ""), file=out)
+    cols = ["mean_ms"] + [f"p{p:g}_ms" for p in PERCENTILES] + ["max_ms"]
+    print(f"  {'op':<8} {'count':>8}" + "".join(f"{c:>11}" for c in cols), file=out)
+    for op, s in r["latency"].items():
+        print(f"  {op:<8} {s['count']:>8}" + "".join(f"{s[c]:>11.3f}" for c in cols), file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description="YCSB-style KV store benchmark")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="a", help="YCSB core workload to start from")
+    parser.add_argument("--read", type=float, default=None, help="share of gets (overrides the workload)")
+    parser.add_argument("--put", type=float, default=None, help="share of puts")
+    parser.add_argument("--append", type=float, default=None, help="share of appends; appended values grow without bound")
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--dist", choices=sorted(DISTRIBUTIONS), default=None, help="key distribution")
+    parser.add_argument("--value-size", type=int, default=100, help="bytes, or the mean for non-fixed sizes")
+    parser.add_argument("--value-dist", choices=VALUE_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="open loop at this many ops/s in total; 0 for closed loop")
+    parser.add_argument("--outstanding", type=int, default=4, help="open loop: ops each client may have in flight")
+    parser.add_argument("--duration", type=float, default=5, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds run before measuring")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--replicas", type=int, default=1)
+    parser.add_argument("--unreliable", action="store_true")
+    parser.add_argument("--lanes", type=int, metavar="THRESHOLD", default=None,
+                        help="send requests over THRESHOLD bytes in the bulk lane")
+    parser.add_argument("--max-active", type=int, default=None, help="requests each server runs at once")
+    parser.add_argument("--max-waiting", type=int, default=None, help="requests each server queues beyond --max-active")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON; - for stdout only")
+    args = parser.parse_args()
+
+    mix = dict(WORKLOADS[args.workload])
+    if any(v is not None for v in (args.read, args.put, args.append)):
+        mix.update(read=args.read or 0.0, put=args.put or 0.0, append=args.append or 0.0)
+    if args.dist:
+        mix["dist"] = args.dist
+    w = Workload(keys=args.keys, value_size=args.value_size, value_dist=args.value_dist, seed=args.seed, **mix)
+    # the servers and labgob may print; keep stdout for the JSON
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.json == "-" else contextlib.nullcontext()
+    with quiet:
+        r = run_workload(w, args.clients, args.duration, args.warmup, args.rate, args.shards, args.replicas, args.unreliable,
+                         args.lanes, args.max_active, args.max_waiting, args.outstanding)
+    r["name"] = args.workload
+
+    if args.json == "-":
+        json.dump(r, sys.stdout, indent=2)
+        print()
+        return
+    print_result(r)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(r, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import collections
+import random
+import unittest
+
+import kv_bench
+
+# Test: the load generator runs, closed and open loop, on a sharded cluster
+class TestKvBench(unittest.TestCase):
+    def test_kv_bench(self):
+        rng = random.Random(0)
+        z = kv_bench.Zipfian(100)
+        counts = collections.Counter(z.next(rng) for _ in range(20000))
+        self.assertEqual(counts.most_common(1)[0][0], 0)
+        self.assertTrue(all(0 <= k < 100 for k in counts))
+        for n in (1, 2):
+            z = kv_bench.Zipfian(n)
+            self.assertEqual(set(z.next(rng) for _ in range(1000)), set(range(n)))
+
+        w = kv_bench.Workload(read=0.5, put=0.25, append=0.25, keys=50, value_dist="uniform", value_size=20)
+        for rate in (0, 200):
+            r = kv_bench.run_workload(w, nclients=3, duration=0.5, warmup=0.1, rate=rate, nshards=2)
+            self.assertGreater(r["ops"], 0)
+            lat = r["latency"]["all"]
+            self.assertEqual(lat["count"], r["ops"])
+            self.assertLessEqual(lat["p50_ms"], lat["p99_ms"])
+            self.assertLessEqual(lat["p99.9_ms"], lat["max_ms"])
+
+        w = kv_bench.Workload(read=0.5, put=0.5, keys=20, value_size=2000)
+        r = kv_bench.run_workload(w, nclients=3, duration=0.3, warmup=0.1, lanes=1000, max_active=1, max_waiting=8)
+        self.assertGreater(r["latency"]["get"]["count"], 0)
+        self.assertEqual((r["lanes"], r["max_active"], r["max_waiting"]), (1000, 1, 8))
@@ -0,0 +1,62 @@
+import threading
+import time
+import zlib
+
+# Threshold-based zlib compression with accounting. Anything shorter than
+# threshold bytes, or that does not shrink, is left alone, so small
+# messages pay nothing but a length check.
+
+class Compressor:
+    def __init__(self, threshold=0, level=1):
+        self.mu = threading.Lock()
+        self.threshold = threshold  # 0 disables compression
+        self.level = level
+        self.reset()
+
+    def reset(self):
+        with self.mu:
+            self.count = 0  # payloads compressed
+            self.raw = 0  # their size before compression
+            self.compressed = 0  # and after
+            self.compress_secs = 0.0
+            self.decompress_secs = 0.0
+
+    def configure(self, threshold, level=1):
+        with self.mu:
+            self.threshold = threshold
+            self.level = level
+
+    # returns the compressed bytes, or None if data should be sent as is.
+    def compress(self, data):
+        if not self.threshold or len(data) < self.threshold:
+            return None
+        t0 = time.perf_counter()
+        z = zlib.compress(data, self.level)
+        dt = time.perf_counter() - t0
+        with self.mu:
+            self.compress_secs += dt
+            if len(z) >= len(data):
+                return None
+            self.count += 1
+            self.raw += len(data)
+            self.compressed += len(z)
+        return z
+
+    def decompress(self, z):
+        t0 = time.perf_counter()
+        data = zlib.decompress(z)
+        dt = time.perf_counter() - t0
+        with self.mu:
+            self.decompress_secs += dt
+        return data
+
+    def stats(self) -> dict:
+        with self.mu:
+            return {
+                "count": self.count,
+                "raw_bytes": self.raw,
+                "compressed_bytes": self.compressed,
+                "ratio": self.raw / self.compressed if self.compressed else 1.0,
+                "compress_secs": self.compress_secs,
+                "decompress_secs": self.decompress_secs,
+            }
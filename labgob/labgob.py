@@ -1,19 +1,154 @@
 import pickle
 import io
+import os
+import random
 import threading
 import inspect
 import logging
 import unicodedata
 from typing import List, Dict, Tuple, Any
 
+from labgob import schema
+from labgob.compress import Compressor
+
 # Initialize global variables
 mu = threading.Lock()
 error_count = 0  # for TestCapital
 checked = {}
 
+# how much development checking decode() does on each message:
+#   "full"   - every message (the default)
+#   "type"   - the first message of each type only
+#   "sample" - a random fraction sample_rate of messages
+#   "off"    - none, for production runs
+VALIDATION_MODES = ("full", "type", "sample", "off")
+validation = "full"
+sample_rate = 0.01
+validated = set()  # types already checked in "type" mode
+
+def set_validation(mode, rate=None):
+    global validation, sample_rate
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"labgob: unknown validation mode {mode!r}; expecting one of {VALIDATION_MODES}")
+    with mu:
+        validation = mode
+        if rate is not None:
+            sample_rate = rate
+        validated.clear()
+
+# LABGOB_VALIDATION=<mode> picks the mode for a whole run
+set_validation(os.environ.get("LABGOB_VALIDATION") or "full")
+
+def should_validate(e) -> bool:
+    if validation == "full":
+        return True
+    if validation == "off":
+        return False
+    if validation == "sample":
+        return random.random() < sample_rate
+    t = type(e)
+    if t in validated:
+        return False
+    with mu:
+        if t in validated:
+            return False
+        validated.add(t)
+    return True
+
+# Protocol 5 lets buffer objects (bytearray, PickleBuffer, memoryview
+# exporters) travel out of band instead of being copied into the pickle.
+PROTOCOL = 5
+
+class Frame:
+    # an encoded message whose large buffers were kept out of band
+    __slots__ = ("data", "buffers")
+
+    def __init__(self, data, buffers):
+        self.data = data
+        self.buffers = buffers
+
+    def __len__(self):
+        return len(self.data) + sum(memoryview(b).nbytes for b in self.buffers)
+
+# "schema" encodes types registered with register_schema() in the compact
+# format of labgob.schema and pickles everything else; "pickle" pickles
+# everything.
+CODECS = ("schema", "pickle")
+codec = os.environ.get("LABGOB_CODEC", "schema")
+
+def set_codec(name):
+    global codec
+    if name not in CODECS:
+        raise ValueError(f"labgob: unknown codec {name!r}; expecting one of {CODECS}")
+    codec = name
+
+# register cls for the compact encoding under a tag that must be unique
+# and identical on both ends; fields is a list of (attribute, "int" | "str").
+# Any attribute may also be None.
+def register_schema(tag, cls, fields):
+    schema.register(tag, cls, fields)
+
+# encoded messages of at least threshold bytes are zlib-compressed when
+# that makes them smaller; 0 (the default) turns compression off.
+COMPRESSED_MAGIC = 0x02
+compressor = Compressor(int(os.environ.get("LABGOB_COMPRESS", "0")))
+
+def set_compression(threshold, level=1):
+    compressor.configure(threshold, level)
+
+# count, sizes, ratio and CPU seconds spent, since the last reset
+def compression_stats():
+    return compressor.stats()
+
+# encode a whole message in one call. pickle.dumps() uses the C pickler
+# directly, with no BytesIO or Pickler to construct per message.
+def encode(e):
+    data = encode1(e)
+    if compressor.threshold and not isinstance(data, Frame):
+        z = compressor.compress(data)
+        if z is not None:
+            return bytes([COMPRESSED_MAGIC]) + z
+    return data
+
+def encode1(e):
+    check_value(e)
+    s = schema.by_type.get(type(e)) if codec == "schema" else None
+    if s is not None:
+        try:
+            return schema.encode(s, e)
+        except schema.Mismatch:
+            pass
+    buffers = []
+    data = pickle.dumps(e, PROTOCOL, buffer_callback=buffers.append)
+    if buffers:
+        return Frame(data, buffers)
+    return data
+
+# decode a message produced by encode(). Out-of-band buffers are copied
+# once here, so the decoded value never shares memory with the sender's:
+# a server must not see a client change its arguments after the call.
+def decode(data):
+    if not isinstance(data, Frame) and data[0] == COMPRESSED_MAGIC:
+        data = compressor.decompress(memoryview(data)[1:])
+    if isinstance(data, Frame):
+        e = pickle.loads(memoryview(data.data), buffers=[copy_buffer(b) for b in data.buffers])
+    elif data[0] == schema.SCHEMA_MAGIC:
+        e = schema.decode(data)
+    else:
+        e = pickle.loads(memoryview(data))
+    if should_validate(e):
+        check_value(e)
+        check_default(e)
+    return e
+
+# a private copy of an out-of-band buffer, writable only if the original was
+def copy_buffer(b):
+    m = memoryview(b)
+    return bytes(m) if m.readonly else bytearray(m)
+
 class LabEncoder:
     def __init__(self, w):
-        self.pickle = pickle.Pickler(w)
+        self.pickle = pickle.Pickler(w, PROTOCOL)
 
     def encode(self, e):
         check_value(e)
@@ -25,8 +160,9 @@ class LabDecoder:
 
     def decode(self):
         e = self.pickle.load()
-        check_value(e)
-        check_default(e)
+        if should_validate(e):
+            check_value(e)
+            check_default(e)
         return e
 
 def check_value(value):
@@ -70,7 +206,12 @@ def check_default1(value, depth, name):
             name1 = f"{name}.{attr}" if name else attr
             check_default1(val, depth + 1, name1)
     else:
-        if value != type(value)():
+        try:
+            default = t()
+        except TypeError:
+            # no default value to compare with, e.g. memoryview
+            return
+        if value != default:
             if error_count < 1:
                 what = name or t.__name__
                 print(f"labgob warning: Decoding into a non-default variable/field {what} may not work")
@@ -0,0 +1,168 @@
+import argparse
+import base64
+import json
+import random
+import sys
+import timeit
+
+from labgob import labgob
+from server import GetArgs, GetReply, PutAppendArgs, PutAppendReply
+
+# Benchmarks for labgob. Run from the repository root:
+#
+#   python -m labgob.labgob_bench                 # codec comparison
+#   python -m labgob.labgob_bench --validation    # decode lint cost
+#   python -m labgob.labgob_bench --json out.json
+#
+# Message contents come from a seeded generator, so every run encodes the
+# same bytes. Timings are the best of several repeats.
+
+KiB = 1024
+MiB = 1024 * KiB
+SIZES = [0, 16, KiB, 64 * KiB, MiB, 16 * MiB]
+DEPTHS = [0, 1, 2, 3]
+FANOUT = 4
+
+# values like the tests': base64 text of random bytes.
+def value_of(size, seed=0):
+    rng = random.Random(seed)
+    return base64.urlsafe_b64encode(rng.randbytes(size)).decode()[:size]
+
+def kv_messages(value_size=16, seed=0):
+    value = value_of(value_size, seed)
+    put = PutAppendArgs("17", value)
+    put.client_id = 1234567890123
+    put.seq_num = 42
+    put.op = "Append"
+    get = GetArgs("17")
+    get.client_id = 1234567890123
+    get.seq_num = 43
+    return {
+        "PutAppendArgs": put,
+        "PutAppendReply": PutAppendReply(value),
+        "GetArgs": get,
+        "GetReply": GetReply(value),
+    }
+
+# a message nested depth levels deep: lists of FANOUT dicts of ... of
+# PutAppendArgs, as a batching layer might send.
+def nested(depth, value_size=16):
+    if depth == 0:
+        return kv_messages(value_size)["PutAppendArgs"]
+    if depth % 2:
+        return [nested(depth - 1, value_size) for _ in range(FANOUT)]
+    return {str(i): nested(depth - 1, value_size) for i in range(FANOUT)}
+
+def time_us(fn, number, repeat):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+# like time_us, but picks the number of iterations so each repeat takes
+# at least budget seconds.
+def time_auto_us(fn, budget, repeat):
+    number = 1
+    while True:
+        t = timeit.timeit(fn, number=number)
+        if t >= budget:
+            break
+        number = max(number * 2, int(number * budget / max(t, 1e-9)))
+    return time_us(fn, number, repeat)
+
+def measure(msg, budget, repeat):
+    data = labgob.encode(msg)
+    enc = time_auto_us(lambda: labgob.encode(msg), budget, repeat)
+    dec = time_auto_us(lambda: labgob.decode(data), budget, repeat)
+    n = len(data)
+    return {
+        "bytes": n,
+        "encode_us": enc,
+        "decode_us": dec,
+        "encode_MBps": n / enc if enc else 0.0,
+        "decode_MBps": n / dec if dec else 0.0,
+    }
+
+# each codec on its own and with compression of messages above the
+# threshold, e.g. "schema+zlib".
+def codec_modes():
+    return list(labgob.CODECS) + [c + "+zlib" for c in labgob.CODECS]
+
+def set_mode(mode, threshold):
+    codec, _, compression = mode.partition("+")
+    labgob.set_codec(codec)
+    labgob.set_compression(threshold if compression else 0)
+
+# every (message, size or depth, codec) combination; each result row is a
+# flat dict, ready for JSON.
+def bench_codecs(sizes=SIZES, depths=DEPTHS, modes=None, budget=0.05, repeat=3, threshold=KiB):
+    modes = modes or codec_modes()
+    saved = labgob.codec, labgob.compressor.threshold
+    rows = []
+    try:
+        for mode in modes:
+            set_mode(mode, threshold)
+            for size in sizes:
+                for name, msg in kv_messages(size).items():
+                    rows.append(dict(measure(msg, budget, repeat), codec=mode, message=name, value_size=size, depth=0))
+            for depth in depths:
+                if depth == 0:
+                    continue
+                rows.append(dict(measure(nested(depth), budget, repeat), codec=mode, message="nested", value_size=16, depth=depth))
+    finally:
+        labgob.set_codec(saved[0])
+        labgob.set_compression(saved[1])
+    return rows
+
+def print_codecs(rows, out=sys.stdout):
+    print(f"{'codec':<12} {'message':<15} {'size':>9} {'depth':>5} {'bytes':>10} "
+          f"{'enc us':>11} {'dec us':>11} {'enc MB/s':>9} {'dec MB/s':>9}", file=out)
+    for r in rows:
+        print(f"{r['codec']:<12} {r['message']:<15} {r['value_size']:>9} {r['depth']:>5} {r['bytes']:>10} "
+              f"{r['encode_us']:>11.2f} {r['decode_us']:>11.2f} {r['encode_MBps']:>9.1f} {r['decode_MBps']:>9.1f}", file=out)
+
+def bench_validation(number=20000, repeat=5):
+    msgs = kv_messages()
+    encoded = {name: labgob.encode(m) for name, m in msgs.items()}
+    saved_mode = labgob.validation
+    results = {}
+    try:
+        for mode in labgob.VALIDATION_MODES:
+            labgob.set_validation(mode)
+            results[mode] = {name: time_us(lambda d=d: labgob.decode(d), number, repeat)
+                             for name, d in encoded.items()}
+    finally:
+        labgob.set_validation(saved_mode)
+    return results
+
+def print_validation(results, out=sys.stdout):
+    names = list(next(iter(results.values())))
+    print("decode cost by validation mode (us/message)", file=out)
+    print(f"{'mode':<8}" + "".join(f"{n:>16}" for n in names) + f"{'us/KV RPC':>12}", file=out)
+    for mode, r in results.items():
+        # one RPC decodes its args on the server and its reply on the client
+        rpc = (r["PutAppendArgs"] + r["PutAppendReply"] + r["GetArgs"] + r["GetReply"]) / 2
+        print(f"{mode:<8}" + "".join(f"{r[n]:>16.2f}" for n in names) + f"{rpc:>12.2f}", file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description="labgob benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="value sizes in bytes")
+    parser.add_argument("--depths", type=int, nargs="+", default=DEPTHS, help="nesting depths")
+    parser.add_argument("--codecs", nargs="+", default=None, choices=codec_modes(), help="codec modes to compare")
+    parser.add_argument("--compress-threshold", type=int, default=KiB, help="smallest message the +zlib modes compress")
+    parser.add_argument("--budget", type=float, default=0.05, help="minimum seconds per timing")
+    parser.add_argument("--repeat", type=int, default=3, help="timings per measurement")
+    parser.add_argument("--validation", action="store_true", help="benchmark decode validation modes instead")
+    parser.add_argument("--json", metavar="FILE", help="also write results as JSON")
+    args = parser.parse_args()
+
+    if args.validation:
+        results = bench_validation(repeat=args.repeat)
+        print_validation(results)
+    else:
+        results = bench_codecs(args.sizes, args.depths, args.codecs, args.budget, args.repeat, args.compress_threshold)
+        print_codecs(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import unittest
 import pickle
 import io
+import os
 
 from labgob.labgob import *
 
@@ -126,3 +127,150 @@ class TestDefault(unittest.TestCase):
         r = io.BytesIO(data)
         d = LabDecoder(r)
         reply = d.decode()
+
+# encode()/decode() are the one-shot codec labrpc uses for every RPC.
+class TestFrame(unittest.TestCase):
+    def test_frame(self):
+        t1 = T1(1, 2, "x" * 1000, "y")
+        data = encode(t1)
+        self.assertIsInstance(data, bytes)
+        t1 = decode(data)
+        self.assertEqual(t1.T1int1, 2)
+        self.assertEqual(t1.T1string0, "x" * 1000)
+
+        # large buffers travel out of band, but the decoded value is the
+        # receiver's own copy, which later writes by the sender don't touch
+        payload = bytearray(b"z" * (1 << 20))
+        frame = encode(pickle.PickleBuffer(payload))
+        self.assertIsInstance(frame, Frame)
+        self.assertLess(len(frame.data), 100)
+        self.assertGreaterEqual(len(frame), 1 << 20)
+        view = decode(frame)
+        payload[0] = ord("a")
+        self.assertEqual(bytes(view[:2]), b"zz")
+        self.assertFalse(memoryview(view).readonly)
+
+        t2 = T2()
+        buf = bytearray(b"q" * 4096)
+        t2.T2slice = [buf]
+        t2 = decode(encode(t2))
+        buf[0] = ord("r")
+        self.assertEqual(t2.T2slice[0], bytearray(b"q" * 4096))
+
+# validation modes trade the development lint for decode speed.
+class TestValidation(unittest.TestCase):
+    def test_validation(self):
+        from labgob import labgob as lg
+        self.addCleanup(lg.set_validation, lg.validation)
+
+        data = encode(DD(5))  # non-default, so check_default complains
+
+        lg.set_validation("off")
+        e0 = lg.error_count
+        decode(data)
+        self.assertEqual(lg.error_count, e0)
+
+        lg.set_validation("type")
+        decode(data)
+        self.assertEqual(lg.error_count, e0 + 1)
+        decode(data)
+        self.assertEqual(lg.error_count, e0 + 1, "type mode should check each type once")
+
+        lg.set_validation("sample", 1.0)
+        decode(data)
+        self.assertEqual(lg.error_count, e0 + 2)
+
+        lg.set_validation("full")
+        decode(data)
+        decode(data)
+        self.assertEqual(lg.error_count, e0 + 4)
+
+        with self.assertRaises(ValueError):
+            lg.set_validation("fast")
+
+        # a misspelled LABGOB_VALIDATION fails the import
+        import subprocess, sys
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for mode, ok in (("off", True), ("ful", False)):
+            r = subprocess.run([sys.executable, "-c", "import labgob.labgob"], cwd=root, capture_output=True, text=True,
+                               env=dict(os.environ, LABGOB_VALIDATION=mode))
+            self.assertEqual(r.returncode == 0, ok, r.stderr)
+        self.assertIn("unknown validation mode 'ful'", r.stderr)
+
+class S1:
+    def __init__(self, Id=None, Name=None):
+        self.Id = Id
+        self.Name = Name
+
+register_schema(100, S1, [("Id", "int"), ("Name", "str")])
+
+# registered types use the compact schema encoding, with pickle as the
+# fallback for anything that does not fit the schema.
+class TestSchema(unittest.TestCase):
+    def test_schema(self):
+        from labgob import labgob as lg
+        self.addCleanup(lg.set_codec, lg.codec)
+        lg.set_codec("schema")
+
+        for v in [S1(), S1(0, ""), S1(-1, "x"), S1((1 << 62) + 5, "été"),
+                  S1(-(1 << 70), "y" * 100000), S1(127, "z" * 300)]:
+            data = encode(v)
+            self.assertEqual(data[0], 0x01)
+            v1 = decode(data)
+            self.assertIsInstance(v1, S1)
+            self.assertEqual(v1.Id, v.Id)
+            self.assertEqual(v1.Name, v.Name)
+
+        self.assertLess(len(encode(S1(42, "hello"))), len(pickle.dumps(S1(42, "hello"), PROTOCOL)) // 4)
+
+        # values that do not fit the schema are pickled
+        for v in [S1("42", "x"), S1(1, b"x"), S1(True, "x"), S1(1 << 3000, "x"), S1(1, "\ud800")]:
+            data = encode(v)
+            self.assertEqual(data[0], 0x80)
+            self.assertEqual(decode(data).Id, v.Id)
+            self.assertEqual(decode(data).Name, v.Name)
+        extra = S1(1, "x")
+        extra.More = 2
+        self.assertEqual(decode(encode(extra)).More, 2)
+
+        lg.set_codec("pickle")
+        self.assertEqual(encode(S1(1, "x"))[0], 0x80)
+
+        with self.assertRaises(ValueError):
+            register_schema(100, T3, [("T3int999", "int")])
+        with self.assertRaises(ValueError):
+            register_schema(101, T3, [("T3int999", "float")])
+        class Slotted:
+            __slots__ = ("Id",)
+        with self.assertRaises(ValueError):
+            register_schema(102, Slotted, [("Id", "int")])
+
+# large messages are compressed when compression is on; small ones are not.
+class TestCompression(unittest.TestCase):
+    def test_compression(self):
+        from labgob import labgob as lg
+        self.addCleanup(lg.set_compression, lg.compressor.threshold)
+        lg.set_compression(1024)
+        lg.compressor.reset()
+
+        small = T1(1, 2, "x" * 100, "y")
+        self.assertNotEqual(encode(small)[0], lg.COMPRESSED_MAGIC)
+
+        big = T1(1, 2, "x" * 100000, "y")
+        data = encode(big)
+        self.assertEqual(data[0], lg.COMPRESSED_MAGIC)
+        self.assertLess(len(data), 1000)
+        self.assertEqual(decode(data).T1string0, "x" * 100000)
+
+        stats = compression_stats()
+        self.assertEqual(stats["count"], 1)
+        self.assertGreater(stats["ratio"], 100)
+        self.assertGreater(stats["compress_secs"], 0)
+
+        # incompressible data is sent as is
+        noise = T1(1, 2, os.urandom(5000), "y")
+        self.assertNotEqual(encode(noise)[0], lg.COMPRESSED_MAGIC)
+
+        # and compressed messages still decode after compression is off
+        lg.set_compression(0)
+        self.assertEqual(decode(data).T1string0, "x" * 100000)
@@ -0,0 +1,130 @@
+# Compact binary encoding for registered message types.
+#
+# A registered type is encoded as
+#
+#   SCHEMA_MAGIC, tag, presence bitmap, fields...
+#
+# where the presence bitmap has bit i set when field i is not None and
+# only present fields follow, in registration order:
+#
+#   "int": zigzag-encoded, as a length byte plus that many little-endian
+#          bytes (1-9 bytes for a 62-bit client id)
+#   "str": a length-prefixed UTF-8 string
+#
+# Lengths, tags and the bitmap are varints. Nothing about the class or the
+# attribute names is sent, unlike a pickle. Any message that does not fit
+# its schema exactly (an unexpected type, an extra attribute, an int of
+# more than 255 bytes or a str that is not valid UTF-8, like a lone
+# surrogate) is left to the caller to pickle instead. Registered classes
+# must keep their attributes in a __dict__, not __slots__.
+
+from labgob.varint import varint, read_varint, zigzag, unzigzag
+
+# pickles (protocol 2 and up) always start with 0x80, so one byte tells
+# the two encodings apart.
+SCHEMA_MAGIC = 0x01
+
+INT = "int"
+STR = "str"
+KINDS = (INT, STR)
+
+BYTE = [bytes([i]) for i in range(256)]
+
+class Mismatch(Exception):
+    pass
+
+class Schema:
+    def __init__(self, tag, cls, fields):
+        self.tag = tag
+        self.cls = cls
+        self.fields = fields  # [(name, kind)]
+        self.names = {name for name, _ in fields}
+        self.header = bytes([SCHEMA_MAGIC]) + varint(tag)
+
+by_type = {}  # cls -> Schema
+by_tag = {}  # tag -> Schema
+
+def register(tag, cls, fields):
+    for name, kind in fields:
+        if kind not in KINDS:
+            raise ValueError(f"labgob: field {name} of {cls.__name__} has unknown kind {kind!r}; expecting one of {KINDS}")
+    if not cls.__dictoffset__:
+        raise ValueError(f"labgob: {cls.__name__} has no __dict__ (it uses __slots__); only such classes can have a schema")
+    if tag in by_tag and by_tag[tag].cls is not cls:
+        raise ValueError(f"labgob: schema tag {tag} is already used by {by_tag[tag].cls.__name__}")
+    # intern the kinds so the codec can compare them by identity
+    schema = Schema(tag, cls, [(name, INT if kind == INT else STR) for name, kind in fields])
+    by_type[cls] = schema
+    by_tag[tag] = schema
+
+def encode(schema, e):
+    d = e.__dict__
+    if d.keys() != schema.names:
+        raise Mismatch()
+    present = 0
+    bit = 1
+    parts = []
+    for name, kind in schema.fields:
+        v = d[name]
+        if v is not None:
+            present |= bit
+            if kind is INT:
+                if type(v) is not int:
+                    raise Mismatch()
+                z = zigzag(v)
+                n = (z.bit_length() + 7) >> 3
+                if n > 255:
+                    raise Mismatch()
+                parts.append(BYTE[n])
+                parts.append(z.to_bytes(n, "little"))
+            else:
+                if type(v) is not str:
+                    raise Mismatch()
+                try:
+                    b = v.encode()
+                except UnicodeEncodeError:
+                    raise Mismatch() from None
+                n = len(b)
+                parts.append(BYTE[n] if n < 0x80 else varint(n))
+                parts.append(b)
+        bit <<= 1
+    return b"".join((schema.header, BYTE[present] if present < 0x80 else varint(present), *parts))
+
+def decode(data):
+    tag = data[1]
+    pos = 2
+    if tag >= 0x80:
+        tag, pos = read_varint(data, 1)
+    schema = by_tag.get(tag)
+    if schema is None:
+        raise ValueError(f"labgob: no schema registered for tag {tag}")
+    present = data[pos]
+    pos += 1
+    if present >= 0x80:
+        present, pos = read_varint(data, pos - 1)
+    e = schema.cls.__new__(schema.cls)
+    d = e.__dict__
+    bit = 1
+    for name, kind in schema.fields:
+        if not present & bit:
+            d[name] = None
+        elif kind is INT:
+            n = data[pos]
+            pos += 1
+            z = int.from_bytes(data[pos:pos + n], "little")
+            pos += n
+            d[name] = unzigzag(z)
+        else:
+            n = data[pos]
+            if n < 0x80:
+                pos += 1
+            else:
+                n, pos = read_varint(data, pos)
+            if n < 4096:
+                d[name] = str(data[pos:pos + n], "utf-8")
+            else:
+                # decode large values in place, without slicing a copy first
+                d[name] = str(memoryview(data)[pos:pos + n], "utf-8")
+            pos += n
+        bit <<= 1
+    return e
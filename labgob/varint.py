@@ -0,0 +1,32 @@
+# Variable-length integers, shared by the compact message codec
+# (labgob.schema) and the KV history file format (models.kvhistory).
+#
+# A varint is 7 bits per byte, least significant first, with the high bit
+# set on every byte but the last. zigzag maps signed to unsigned ints so
+# that small negative numbers stay short: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+
+def varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+# the varint at buf[pos], and the position after it
+def read_varint(buf, pos: int):
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def zigzag(n: int) -> int:
+    return (n << 1) if n >= 0 else ((-n << 1) - 1)
+
+def unzigzag(z: int) -> int:
+    return (z >> 1) if not z & 1 else -((z + 1) >> 1)
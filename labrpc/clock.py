@@ -0,0 +1,159 @@
+import contextlib
+import heapq
+import random
+import threading
+import time
+
+# Clocks drive every delay, drop and reordering decision the simulated
+# network makes. RealClock uses wall-clock time and the global random
+# module, exactly as labrpc always has. VirtualClock runs a discrete-event
+# scheduler over simulated time, so seconds of injected delay cost
+# microseconds of real time.
+#
+# Virtual time only moves on once nothing that could still act "now" is
+# running. Each such piece of work holds the clock: every RPC from the
+# moment it is sent until it is delivered (except while it sleeps or
+# waits on a timer), and every thread that participates, i.e. runs
+# under participate() or was started by go(). A participant that makes
+# an RPC lends its hold to the request and gets it back with the reply.
+# Threads that do not participate, like the tests' client threads, only
+# hold the clock while one of their RPCs is in flight, so two of them
+# whose calls start a moment apart in real time may start them far
+# apart in virtual time.
+
+class RealClock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, secs: float):
+        if secs > 0:
+            time.sleep(secs)
+
+    def after(self, secs: float, fn):
+        threading.Timer(secs, fn).start()
+
+    def rng(self, endname, n: int):
+        return random
+
+    def hold(self):
+        pass
+
+    def release(self):
+        pass
+
+    def participating(self) -> bool:
+        return False
+
+    def participate(self):
+        return contextlib.nullcontext()
+
+    def go(self, fn, *args) -> threading.Thread:
+        th = threading.Thread(target=fn, args=args)
+        th.start()
+        return th
+
+    def stop(self):
+        pass
+
+class VirtualClock:
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.cond = threading.Condition()
+        self.t = 0.0
+        self.events = []  # heap of (when, seq, fn, wakes); wakes: fn resumes a holder
+        self.seq = 0
+        self.busy = 0  # holds on the clock; time stands still while any is out
+        self.local = threading.local()  # .depth: participate() nesting of this thread
+        self.stopped = False
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def now(self) -> float:
+        with self.cond:
+            return self.t
+
+    def after(self, secs: float, fn):
+        with self.cond:
+            self._push(secs, fn, False)
+
+    def _push(self, secs, fn, wakes):
+        heapq.heappush(self.events, (self.t + max(secs, 0), self.seq, fn, wakes))
+        self.seq += 1
+        self.cond.notify()
+
+    # the caller must hold the clock; it lets go while asleep and holds
+    # it again from the instant it is woken.
+    def sleep(self, secs: float):
+        if secs <= 0:
+            return
+        woken = threading.Event()
+        with self.cond:
+            self._push(secs, woken.set, True)
+            self.busy -= 1
+        woken.wait()
+
+    def hold(self):
+        with self.cond:
+            self.busy += 1
+
+    def release(self):
+        with self.cond:
+            self.busy -= 1
+            if self.busy == 0:
+                self.cond.notify()
+
+    def participating(self) -> bool:
+        return getattr(self.local, "depth", 0) > 0
+
+    # the calling thread holds the clock for the duration
+    @contextlib.contextmanager
+    def participate(self):
+        self.hold()
+        self.local.depth = getattr(self.local, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self.local.depth -= 1
+            self.release()
+
+    # starts fn(*args) in a participating thread. The hold is taken
+    # here, so virtual time cannot move on before the thread gets going.
+    # Like any threading.Thread, and unlike the clock's own machinery,
+    # the thread is not a daemon: the interpreter waits for it to finish.
+    def go(self, fn, *args) -> threading.Thread:
+        self.hold()
+        def run():
+            self.local.depth = 1
+            try:
+                fn(*args)
+            finally:
+                self.local.depth = 0
+                self.release()
+        th = threading.Thread(target=run)
+        th.start()
+        return th
+
+    # every random decision about the n'th request sent on an end comes
+    # from its own generator, so the fate of each RPC depends only on the
+    # seed, the end name and the order in which that end issued calls --
+    # not on how the OS happened to interleave the client threads.
+    def rng(self, endname, n: int):
+        return random.Random(f"{self.seed}/{endname}/{n}")
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while (not self.events or self.busy > 0) and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                when, _, fn, wakes = heapq.heappop(self.events)
+                self.t = max(self.t, when)
+                if wakes:
+                    self.busy += 1
+            fn()
@@ -2,14 +2,23 @@ import threading
 import logging
 import random
 import time
-import io
 import queue
 from collections import defaultdict
 
-from labgob.labgob import LabEncoder, LabDecoder
+from labgob import labgob
+from labrpc.clock import RealClock, VirtualClock
+from labrpc.stats import RpcStats
+from labrpc.link import Link, REQUEST, REPLY
+from labrpc.lanes import LaneQueue, DEFAULT_WEIGHTS, no_class
 
 logging.basicConfig(level=logging.FATAL)
 
+# raised by ClientEnd.call when the network or the server is shedding
+# load; the request was never executed, so it is always safe to retry
+# after backing off.
+class OverloadError(TimeoutError):
+    pass
+
 class ReqMsg:
     def __init__(self, endname, svcMeth, argsType, args):
         self.endname = endname  # name of sending ClientEnd
@@ -17,34 +26,70 @@ class ReqMsg:
         self.argsType = argsType
         self.args = args
         self.replyCh = queue.Queue()
+        self.rng = random  # source of fault-injection decisions
+        self.sent = 0.0  # perf_counter() when handed to the network
+        self.queued = 0.0  # seconds spent waiting in endCh
+        self.delay = 0.0  # seconds of injected network delay
+        self.lane = 0  # priority lane; see labrpc.lanes
 
 class ReplyMsg:
     def __init__(self, ok, reply):
         self.ok = ok
         self.reply = reply
+        self.overloaded = False
+        # server-side timings, in seconds
+        self.decode = 0.0
+        self.dispatch = 0.0
+        self.encode = 0.0
 
 class ClientEnd:
     def __init__(self, endname, network):
         self.endname = endname  # this end-point's name
         self.ch = network.endCh
         self.done = network.done
+        self.network = network
 
     def call(self, svcMeth, args):
-        qb = io.BytesIO()
-        LabEncoder(qb).encode(args);
-        req = ReqMsg(self.endname, svcMeth, type(args), qb.getvalue())
+        t0 = time.perf_counter()
+        req = ReqMsg(self.endname, svcMeth, type(args), labgob.encode(args))
+        encode = time.perf_counter() - t0
+        req.lane = self.network.classify(req)
+        req.sent = time.perf_counter()
+
+        # the request holds the clock until it is delivered; a
+        # participating caller lends it its own hold
+        clock = self.network.clock
+        lent = clock.participating()
+        if not lent:
+            clock.hold()
 
         # Send the request
+        if not self.network.admit():
+            if not lent:
+                clock.release()
+            raise OverloadError()
+        self.ch.put(req, req.lane)
+
+        # Wait for the reply; process_req always sends one, even if it
+        # fails, so the hold is given back
         try:
-            self.ch.put(req, block=False)
-        except queue.Full:
-            raise TimeoutError()
-
-        # Wait for the reply
-        rep = req.replyCh.get()
+            rep = req.replyCh.get()
+        finally:
+            if not lent:
+                clock.release()
+        stats = self.network.stats
         if rep.ok:
-            return LabDecoder(io.BytesIO(rep.reply)).decode()
+            if not stats:
+                return labgob.decode(rep.reply)
+            t0 = time.perf_counter()
+            reply = labgob.decode(rep.reply)
+            stats.record(req, rep, encode, time.perf_counter() - t0)
+            return reply
         else:
+            if stats:
+                stats.record_failure(req)
+            if rep.overloaded:
+                raise OverloadError()
             raise TimeoutError()
 
 class Network:
@@ -57,16 +102,33 @@ class Network:
         self.enabled = {}
         self.servers = {}
         self.connections = {}
-        self.endCh = queue.Queue()
+        self.endCh = LaneQueue()
+        self.classify = no_class
+        self.weights = DEFAULT_WEIGHTS
         self.done = threading.Event()
         self.count = 0
         self.bytes = 0
+        self.rejected = 0  # requests refused by admit()
+        self.max_inflight = 0  # see set_max_queue; 0 means unbounded
+        self.inflight = 0  # requests admitted whose process_req has not returned
+        self.clock = RealClock()
+        self.nsent = defaultdict(int)  # endname -> number of requests sent
+        self.stats = None  # RpcStats, once enable_stats() is called
+        self.links = {}  # endname -> Link
+        self.default_link = None  # (latency, bandwidth) for ends without a Link
 
         # single thread to handle all ClientEnd.call()s
         threading.Thread(target=self._process_requests, daemon=True).start()
 
     def cleanup(self):
         self.done.set()
+        self.clock.stop()
+
+    # replace wall-clock delays with a seeded discrete-event simulation.
+    # must be called before any RPCs are sent.
+    def simulate(self, seed):
+        with self.mu:
+            self.clock = VirtualClock(seed)
 
     def reliable(self, yes):
         with self.mu:
@@ -80,6 +142,49 @@ class Network:
         with self.mu:
             self.longDelays = yes
 
+    # bound the number of requests in the network at once: waiting for
+    # the network thread, or being delivered, served and answered by
+    # process_req. 0 means unbounded. ClientEnd.call fails fast with
+    # OverloadError instead of sending when the bound is reached.
+    def set_max_queue(self, n):
+        with self.mu:
+            self.max_inflight = n
+
+    # sort requests into priority lanes with classify(req) -> lane, e.g.
+    # labrpc.lanes.size_class(4096), and serve the lanes in the network
+    # queue and on links by weighted round robin. Servers take their own
+    # weights in Server.set_limits().
+    def set_lanes(self, classify, weights=None):
+        with self.mu:
+            self.classify = classify
+            self.weights = dict(weights or DEFAULT_WEIGHTS)
+            for link in self.links.values():
+                link.weights = self.weights
+        self.endCh.set_weights(self.weights)
+
+    # take a slot for a new request, or count it rejected
+    def admit(self):
+        with self.mu:
+            if self.max_inflight > 0 and self.inflight >= self.max_inflight:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    # model the link from endname to its server; see labrpc.link.Link
+    # for the meaning of latency and bandwidth.
+    def set_link(self, endname, latency=0.0, bandwidth=None):
+        with self.mu:
+            self.links[endname] = Link(latency, bandwidth, self.weights)
+
+    # give every end without its own set_link() a private link like this.
+    def set_default_link(self, latency=0.0, bandwidth=None):
+        with self.mu:
+            self.default_link = (latency, bandwidth)
+            for endname in self.ends:
+                if endname not in self.links:
+                    self.links[endname] = Link(latency, bandwidth, self.weights)
+
     def _process_requests(self):
         while not self.done.is_set():
             try:
@@ -87,9 +192,13 @@ class Network:
             except queue.Empty:
                 continue
 
+            xreq.queued = time.perf_counter() - xreq.sent
+
             with self.mu:
                 self.count += 1
                 self.bytes += len(xreq.args)
+                xreq.rng = self.clock.rng(xreq.endname, self.nsent[xreq.endname])
+                self.nsent[xreq.endname] += 1
 
             threading.Thread(target=self.process_req, args=(xreq,), daemon=True).start()
 
@@ -100,27 +209,55 @@ class Network:
             server = self.servers.get(servername)
             isreliable = self.isreliable
             long_reordering = self.longReordering
+            long_delays = self.longDelays
+            clock = self.clock
+            link = self.links.get(endname)
 
-        return enabled, servername, server, isreliable, long_reordering
+        return enabled, servername, server, isreliable, long_reordering, long_delays, clock, link
 
     def is_server_dead(self, endname, servername, server):
         with self.mu:
             return not self.enabled[endname] or self.servers[servername] != server
 
     def process_req(self, req):
-        enabled, servername, server, isreliable, long_reordering = self.read_endname_info(req.endname)
+        try:
+            self.process_req1(req)
+        except BaseException:
+            # the caller, and its hold on the clock, would otherwise wait
+            # for a reply forever
+            req.replyCh.put(ReplyMsg(False, None))
+            raise
+        finally:
+            with self.mu:
+                self.inflight -= 1
+
+    def process_req1(self, req):
+        enabled, servername, server, isreliable, long_reordering, long_delays, clock, link = self.read_endname_info(req.endname)
+        rng = req.rng
         if enabled and (servername is not None) and (server is not None):
+            if link:
+                d = link.transmit(clock, rng, len(req.args), REQUEST, req.lane)
+                req.delay += d
+                clock.sleep(d)
+
             if not isreliable:
-                time.sleep(random.randint(0, 27) / 1000)
+                ms = rng.randint(0, 27)
+                req.delay += ms / 1000
+                clock.sleep(ms / 1000)
 
-            if not isreliable and random.randint(0, 999) < 100:
+            if not isreliable and rng.randint(0, 999) < 100:
                 req.replyCh.put(ReplyMsg(False, None))
                 return
 
             ech = queue.Queue()
 
             def dispatch():
-                r = server.dispatch(req)
+                try:
+                    r = server.dispatch(req)
+                except BaseException:
+                    # a handler that raises looks like a lost reply
+                    ech.put(ReplyMsg(False, None))
+                    raise
                 ech.put(r)
 
             threading.Thread(target=dispatch, daemon=True).start()
@@ -136,18 +273,33 @@ class Network:
                 except queue.Empty:
                     server_dead = self.is_server_dead(req.endname, servername, server)
 
+            if reply_ok and not server_dead and link and reply.ok:
+                d = link.transmit(clock, rng, len(reply.reply), REPLY, req.lane)
+                req.delay += d
+                clock.sleep(d)
+
             if not reply_ok or server_dead:
                 req.replyCh.put(ReplyMsg(False, None))
-            elif not isreliable and random.randint(0, 999) < 100:
+            elif not isreliable and rng.randint(0, 999) < 100:
                 req.replyCh.put(ReplyMsg(False, None))
-            elif long_reordering and random.randint(0, 899) < 600:
-                ms = 200 + random.randint(0, 2000)
-                threading.Timer(ms / 1000, lambda: req.replyCh.put(reply)).start()
+            elif long_reordering and rng.randint(0, 899) < 600:
+                ms = 200 + rng.randint(0, 2000)
+                req.delay += ms / 1000
+                self.deliver_after(clock, ms / 1000, req, reply)
             else:
                 req.replyCh.put(reply)
         else:
-            ms = random.randint(0, 7000) if self.longDelays else random.randint(0, 100)
-            threading.Timer(ms / 1000, lambda: req.replyCh.put(ReplyMsg(False, None))).start()
+            ms = rng.randint(0, 7000) if long_delays else rng.randint(0, 100)
+            self.deliver_after(clock, ms / 1000, req, ReplyMsg(False, None))
+
+    # hands req's hold on the clock to a timer that delivers rep, so
+    # time can pass while the reply is held back
+    def deliver_after(self, clock, secs, req, rep):
+        def deliver():
+            clock.hold()
+            req.replyCh.put(rep)
+        clock.after(secs, deliver)
+        clock.release()
 
     def make_end(self, endname):
         with self.mu:
@@ -156,6 +308,8 @@ class Network:
 
             e = ClientEnd(endname, self)
             self.ends[endname] = e
+            if self.default_link and endname not in self.links:
+                self.links[endname] = Link(*self.default_link, self.weights)
             self.enabled[endname] = False
             self.connections[endname] = None
 
@@ -168,6 +322,9 @@ class Network:
             del self.ends[endname]
             del self.enabled[endname]
             del self.connections[endname]
+            self.links.pop(endname, None)
+        if self.stats:
+            self.stats.forget_end(endname)
 
     def add_server(self, servername, server):
         with self.mu:
@@ -196,17 +353,105 @@ class Network:
     def get_total_bytes(self):
         return self.bytes
 
+    def get_total_rejected(self):
+        with self.mu:
+            rejected = self.rejected
+            servers = [s for s in self.servers.values() if s]
+        return rejected + sum(s.get_rejected() for s in servers)
+
+    def get_queue_len(self):
+        return self.endCh.qsize()
+
+    def get_inflight(self):
+        with self.mu:
+            return self.inflight
+
+    # start recording per-method and per-end stats for completed calls.
+    # Off by default: the histograms cost every call a lock and a dozen
+    # updates.
+    def enable_stats(self):
+        with self.mu:
+            if self.stats is None:
+                self.stats = RpcStats()
+        return self.stats
+
+    # keep a fraction `sample` of completed calls in a trace log; enables
+    # stats
+    def trace(self, sample, maxlen=10000):
+        self.enable_stats().trace(sample, maxlen)
+
+    # svcMeth -> phase -> Histogram; see labrpc.stats.PHASES
+    def get_method_stats(self):
+        return self.stats.by_method() if self.stats else {}
+
+    # endname -> phase -> Histogram, for ends not yet deleted
+    def get_end_stats(self):
+        return self.stats.by_end() if self.stats else {}
+
+    def get_trace(self):
+        return self.stats.trace_log() if self.stats else []
+
 class Server:
     def __init__(self):
         self.mu = threading.Lock()
         self.services = {}
         self.count = 0
+        # admission control; None means unlimited
+        self.max_active = None
+        self.max_waiting = None
+        self.active = 0  # dispatches currently running
+        self.waiters = LaneQueue()  # dispatches waiting for a slot
+        self.queued = 0  # dispatches that ever had to wait
+        self.rejected = 0  # dispatches refused with an overload reply
 
     def add_service(self, svc):
         with self.mu:
             self.services[svc.name] = svc
 
+    # run at most max_active requests at once and let at most max_waiting
+    # more wait for a slot; anything beyond that gets an immediate
+    # overload reply. Waiting requests are admitted by lane, with weights
+    # as in labrpc.lanes.
+    def set_limits(self, max_active=None, max_waiting=None, weights=None):
+        with self.mu:
+            self.max_active = max_active
+            self.max_waiting = max_waiting
+        if weights:
+            self.waiters.set_weights(weights)
+
+    def admit(self, lane):
+        with self.mu:
+            if self.max_active is None or self.active < self.max_active:
+                self.active += 1
+                return True
+            if self.max_waiting is not None and len(self.waiters) >= self.max_waiting:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            slot = threading.Event()
+            self.waiters.put(slot, lane)
+        # release() hands its slot straight to us
+        slot.wait()
+        return True
+
+    def release(self):
+        with self.mu:
+            if self.waiters:
+                self.waiters.get_nowait().set()
+            else:
+                self.active -= 1
+
     def dispatch(self, req):
+        if not self.admit(req.lane):
+            rep = ReplyMsg(False, None)
+            rep.overloaded = True
+            return rep
+        try:
+            return self.dispatch1(req)
+        finally:
+            self.release()
+
+    def dispatch1(self, req):
         with self.mu:
             self.count += 1
 
@@ -227,6 +472,18 @@ class Server:
         with self.mu:
             return self.count
 
+    def get_rejected(self):
+        with self.mu:
+            return self.rejected
+
+    def get_queued(self):
+        with self.mu:
+            return self.queued
+
+    def get_waiting(self):
+        with self.mu:
+            return len(self.waiters)
+
 class Service:
     def __init__(self, rcvr):
         self.name = type(rcvr).__name__
@@ -244,16 +501,23 @@ class Service:
         method = self.methods.get(methname)
         if method:
             # decode the argument.
-            args = LabDecoder(io.BytesIO(req.args)).decode()
+            t0 = time.perf_counter()
+            args = labgob.decode(req.args)
 
             # call the method
+            t1 = time.perf_counter()
             replyv = method(args)
 
             # encode the reply
-            rb = io.BytesIO()
-            LabEncoder(rb).encode(replyv)
-            reply = rb.getvalue()
-            return ReplyMsg(True, reply)
+            t2 = time.perf_counter()
+            reply = labgob.encode(replyv)
+            t3 = time.perf_counter()
+
+            rep = ReplyMsg(True, reply)
+            rep.decode = t1 - t0
+            rep.dispatch = t2 - t1
+            rep.encode = t3 - t2
+            return rep
         else:
             choices = list(self.methods.keys())
             logging.fatal(f"labrpc.Service.dispatch(): unknown method {methname} in {req.svcMeth}; expecting one of {choices}")
@@ -3,6 +3,7 @@ import time
 import unittest
 
 from labrpc.labrpc import *
+from labrpc.lanes import size_class
 
 class JunkArgs:
     def __init__(self, x):
@@ -56,6 +57,14 @@ class JunkServer:
             reply[0] = "y" * args
         return reply
 
+    def handler8(self, args):
+        time.sleep(args)
+        return [args]
+
+    def handler9(self, args):
+        time.sleep(0.15)
+        return [len(args)]
+
 class TestBasic(unittest.TestCase):
     def test_basic(self):
         rn = Network()
@@ -285,3 +294,388 @@ class TestUnreliable(unittest.TestCase):
         n = rn.get_count(1000)
         self.assertEqual(n, total, f"wrong get_count() {n}, expected {total}")
 
+
+class TestSimulated(unittest.TestCase):
+    def run_schedule(self, seed):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rn.simulate(seed)
+        rn.reliable(False)
+        rn.long_reordering(True)
+        rn.long_delays(True)
+
+        e = rn.make_end("end1-99")
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rn.add_server("server99", rs)
+        rn.connect("end1-99", "server99")
+        rn.enable("end1-99", True)
+
+        outcomes = []
+        for i in range(300):
+            if i == 200:
+                # a disabled end sees up to 7s of (virtual) delay per call
+                rn.enable("end1-99", False)
+            try:
+                reply = e.call("JunkServer.handler2", i)
+                outcomes.append(reply[0])
+            except TimeoutError:
+                outcomes.append(None)
+        return outcomes, rn.clock.now()
+
+    def test_simulated(self):
+        t0 = time.time()
+        outcomes1, vt1 = self.run_schedule(42)
+        outcomes2, vt2 = self.run_schedule(42)
+        real = time.time() - t0
+
+        self.assertEqual(outcomes1, outcomes2, "same seed should replay the same schedule")
+        self.assertEqual(vt1, vt2, "same seed should take the same virtual time")
+        self.assertIn(None, outcomes1, "unreliable network dropped nothing")
+        self.assertEqual(outcomes1[200:], [None] * 100)
+        self.assertGreater(vt1, real, f"virtual time {vt1} should outrun real time {real}")
+
+        outcomes3, _ = self.run_schedule(43)
+        self.assertNotEqual(outcomes1, outcomes3, "different seeds should differ")
+
+    def test_concurrent_delays(self):
+        # two calls started 20ms apart in real time overlap in virtual
+        # time: the one on the fast link finishes first, and the clock
+        # ends after the slow call's round trip, not after both in turn
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rn.simulate(1)
+        rs = Server()
+        rs.add_service(Service(JunkServer()))
+        rn.add_server("server99", rs)
+        ends = {}
+        for name, latency in (("slow", 1.0), ("fast", 0.05)):
+            ends[name] = rn.make_end(name)
+            rn.connect(name, "server99")
+            rn.enable(name, True)
+            rn.set_link(name, latency=latency)
+
+        done = []
+        def client(name):
+            ends[name].call("JunkServer.handler2", 1)
+            done.append((name, rn.clock.now()))
+
+        with rn.clock.participate():
+            threads = [rn.clock.go(client, "slow")]
+            time.sleep(0.02)
+            threads.append(rn.clock.go(client, "fast"))
+        for th in threads:
+            th.join()
+
+        self.assertEqual([name for name, _ in done], ["fast", "slow"])
+        self.assertAlmostEqual(done[0][1], 0.1, delta=0.01)
+        self.assertAlmostEqual(done[1][1], 2.0, delta=0.01)
+        self.assertAlmostEqual(rn.clock.now(), 2.0, delta=0.01)
+
+    def test_handler_raises(self):
+        # a handler that raises fails its call, and gives back the
+        # request's hold, so virtual time keeps moving afterwards
+        class Boom:
+            def Fail(self, args):
+                raise RuntimeError("boom")
+
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rn.simulate(1)
+        rs = Server()
+        rs.add_service(Service(Boom()))
+        rs.add_service(Service(JunkServer()))
+        rn.add_server("server99", rs)
+        e = rn.make_end("end1-99")
+        rn.connect("end1-99", "server99")
+        rn.enable("end1-99", True)
+        rn.set_link("end1-99", latency=1.0)
+
+        hook = threading.excepthook
+        threading.excepthook = lambda args: None
+        self.addCleanup(setattr, threading, "excepthook", hook)
+        with self.assertRaises(TimeoutError):
+            e.call("Boom.Fail", 1)
+        self.assertEqual(e.call("JunkServer.handler2", 1), ["handler2-1"])
+        self.assertAlmostEqual(rn.clock.now(), 3.0, delta=0.01)
+
+class TestStats(unittest.TestCase):
+    def test_stats(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rn.trace(1.0)
+
+        e = rn.make_end("end1-99")
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rn.add_server(99, rs)
+        rn.connect("end1-99", 99)
+        rn.enable("end1-99", True)
+
+        for i in range(10):
+            e.call("JunkServer.handler2", i)
+        for i in range(5):
+            e.call("JunkServer.handler7", 1000)
+
+        stats = rn.get_method_stats()
+        self.assertEqual(stats["JunkServer.handler2"]["dispatch"].count, 10)
+        self.assertEqual(stats["JunkServer.handler7"]["queue"].count, 5)
+        self.assertGreater(stats["JunkServer.handler7"]["reply_bytes"].min, 1000)
+        self.assertLess(stats["JunkServer.handler2"]["reply_bytes"].max, 1000)
+        self.assertGreater(stats["JunkServer.handler2"]["encode"].sum, 0)
+        self.assertEqual(stats["JunkServer.handler2"]["delay"].sum, 0)
+
+        ends = rn.get_end_stats()
+        self.assertEqual(ends["end1-99"]["req_bytes"].count, 15)
+
+        trace = rn.get_trace()
+        self.assertEqual(len(trace), 15)
+        self.assertEqual(trace[-1]["svcMeth"], "JunkServer.handler7")
+
+        h = stats["JunkServer.handler7"]["reply_bytes"]
+        self.assertLessEqual(h.percentile(50), h.max)
+        self.assertGreaterEqual(h.percentile(50), h.max * 0.9)
+
+    def test_stats_off(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rs = Server()
+        rs.add_service(Service(JunkServer()))
+        rn.add_server(99, rs)
+        for name in ("end1-99", "end2-99"):
+            rn.make_end(name)
+            rn.connect(name, 99)
+            rn.enable(name, True)
+
+        rn.ends["end1-99"].call("JunkServer.handler2", 1)
+        self.assertIsNone(rn.stats)
+        self.assertEqual(rn.get_method_stats(), {})
+
+        rn.enable_stats()
+        for name in ("end1-99", "end2-99"):
+            rn.ends[name].call("JunkServer.handler2", 1)
+        self.assertEqual(rn.get_method_stats()["JunkServer.handler2"]["dispatch"].count, 2)
+        rn.delete_end("end1-99")
+        self.assertEqual(list(rn.get_end_stats()), ["end2-99"])
+
+class TestLink(unittest.TestCase):
+    def setup_net(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rn.simulate(1)
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rn.add_server(99, rs)
+        return rn
+
+    def make_end(self, rn, endname):
+        e = rn.make_end(endname)
+        rn.connect(endname, 99)
+        rn.enable(endname, True)
+        return e
+
+    def test_link(self):
+        rn = self.setup_net()
+        rn.set_default_link(latency=0.010, bandwidth=1_000_000)
+        e = self.make_end(rn, "end1-99")
+
+        t0 = rn.clock.now()
+        e.call("JunkServer.handler6", "x")
+        small = rn.clock.now() - t0
+        self.assertAlmostEqual(small, 0.020, delta=0.002)
+
+        # a 1 MB request takes about a second to get onto a 1 MB/s link
+        t0 = rn.clock.now()
+        reply = e.call("JunkServer.handler6", "x" * 1_000_000)
+        self.assertEqual(reply[0], 1_000_000)
+        big = rn.clock.now() - t0
+        self.assertAlmostEqual(big, 1.020, delta=0.01)
+
+        # and the reply direction is charged for its size too
+        t0 = rn.clock.now()
+        reply = e.call("JunkServer.handler7", 500_000)
+        self.assertEqual(len(reply[0]), 500_000)
+        self.assertAlmostEqual(rn.clock.now() - t0, 0.520, delta=0.01)
+
+    def test_link_queueing(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rn.add_server(99, rs)
+        e = self.make_end(rn, "end1-99")
+        rn.set_link("end1-99", latency=(0.001, 0.002), bandwidth=10_000_000)
+
+        t0 = time.monotonic()
+        done = []
+        def client(n):
+            e.call("JunkServer.handler6", "x" * n)
+            done.append(time.monotonic() - t0)
+
+        threads = [threading.Thread(target=client, args=(500_000,)) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # the second message queues behind the first one on the link
+        done.sort()
+        self.assertGreater(done[1], 0.1)
+        self.assertGreater(done[1] - done[0], 0.03)
+
+class TestAdmission(unittest.TestCase):
+    def test_admission(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rs.set_limits(max_active=1, max_waiting=1)
+        rn.add_server(99, rs)
+
+        results = []
+        def client(i):
+            e = rn.make_end(i)
+            rn.connect(i, 99)
+            rn.enable(i, True)
+            try:
+                results.append(e.call("JunkServer.handler8", 0.3))
+            except OverloadError:
+                results.append("overload")
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results.count("overload"), 3, f"results {results}")
+        self.assertEqual(rs.get_count(), 2)
+        self.assertEqual(rs.get_queued(), 1)
+        self.assertEqual(rs.get_rejected(), 3)
+        self.assertEqual(rn.get_total_rejected(), 3)
+        self.assertEqual(rs.get_waiting(), 0)
+
+        # the slots are free again afterwards
+        e = rn.make_end("end1-99")
+        rn.connect("end1-99", 99)
+        rn.enable("end1-99", True)
+        self.assertEqual(e.call("JunkServer.handler8", 0), [0])
+
+    def test_max_queue(self):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        rn.set_max_queue(2)
+
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rn.add_server(99, rs)
+        ends = []
+        for i in range(4):
+            ends.append(rn.make_end(i))
+            rn.connect(i, 99)
+            rn.enable(i, True)
+
+        # two slow calls fill the network...
+        results = []
+        threads = [threading.Thread(target=lambda e=e: results.append(e.call("JunkServer.handler8", 0.5))) for e in ends[:2]]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + 2
+        while rn.get_inflight() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(rn.get_inflight(), 2)
+
+        # ...so more are turned away at once, though endCh is empty
+        for e in ends[2:]:
+            t0 = time.monotonic()
+            with self.assertRaises(OverloadError):
+                e.call("JunkServer.handler8", 0)
+            self.assertLess(time.monotonic() - t0, 0.2)
+        self.assertEqual(rn.get_total_rejected(), 2)
+
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [[0.5], [0.5]])
+        self.assertEqual(rn.get_inflight(), 0)
+        self.assertEqual(ends[2].call("JunkServer.handler8", 0), [0])
+
+class TestLanes(unittest.TestCase):
+    def completion_order(self, lanes):
+        rn = Network()
+        self.addCleanup(rn.cleanup)
+        if lanes:
+            rn.set_lanes(size_class(1000))
+
+        js = JunkServer()
+        rs = Server()
+        rs.add_service(Service(js))
+        rs.set_limits(max_active=1)
+        rn.add_server(99, rs)
+
+        order = []
+        def client(i, args):
+            e = rn.make_end(i)
+            rn.connect(i, 99)
+            rn.enable(i, True)
+            e.call("JunkServer.handler9", args)
+            order.append("small" if len(args) < 1000 else "bulk")
+
+        threads = []
+        def start(i, args):
+            t = threading.Thread(target=client, args=(i, args))
+            t.start()
+            threads.append(t)
+            time.sleep(0.01)
+
+        start(0, "x" * 10000)  # occupies the only slot
+        for i in range(1, 4):
+            start(i, "x" * 10000)
+        for i in range(4, 7):
+            start(i, "x")
+        for t in threads:
+            t.join()
+        return order
+
+    def test_lanes(self):
+        order = self.completion_order(False)
+        self.assertEqual(order, ["bulk"] * 4 + ["small"] * 3)
+
+        # small calls overtake the queued bulk calls
+        order = self.completion_order(True)
+        self.assertEqual(order, ["bulk"] + ["small"] * 3 + ["bulk"] * 3)
+
+    def test_lanes_fairness(self):
+        from labrpc.lanes import LaneQueue
+        q = LaneQueue({0: 2, 1: 1})
+        for i in range(6):
+            q.put(("small", i), 0)
+        for i in range(3):
+            q.put(("bulk", i), 1)
+        got = [q.get_nowait()[0] for _ in range(9)]
+        # bulk work still gets one turn in every round
+        self.assertEqual(got, ["small", "small", "bulk"] * 3)
+
+    def test_link_lanes(self):
+        from labrpc.link import Link, REQUEST
+
+        class FrozenClock:
+            def now(self):
+                return 0.0
+
+        clock = FrozenClock()
+        fifo = Link(bandwidth=1_000_000, weights={0: 1})
+        self.assertAlmostEqual(fifo.transmit(clock, None, 1_000_000, REQUEST), 1.0)
+        self.assertAlmostEqual(fifo.transmit(clock, None, 1000, REQUEST), 1.001)
+
+        # a small message in its own lane only shares bandwidth with the
+        # bulk transfer already in flight
+        link = Link(bandwidth=1_000_000, weights={0: 4, 1: 1})
+        self.assertAlmostEqual(link.transmit(clock, None, 1_000_000, REQUEST, 1), 1.0)
+        self.assertAlmostEqual(link.transmit(clock, None, 1000, REQUEST, 0), 0.00125)
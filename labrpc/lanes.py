@@ -0,0 +1,83 @@
+import queue
+import threading
+from collections import deque
+
+# Priority lanes. Every request is classified into a lane; lower lanes
+# are more latency-critical. Queues serve lanes by weighted round robin:
+# in each round lane i may be picked up to weights[i] times, lanes being
+# tried lowest first, so small calls overtake bulk ones without starving
+# them.
+
+INTERACTIVE = 0
+BULK = 1
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 4, BULK: 1}
+
+# classify by encoded request size: anything larger than threshold bytes
+# is bulk.
+def size_class(threshold):
+    def classify(req):
+        return BULK if len(req.args) > threshold else INTERACTIVE
+    return classify
+
+def no_class(req):
+    return INTERACTIVE
+
+class LaneQueue:
+    def __init__(self, weights=None, maxsize=0):
+        self.cond = threading.Condition()
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.maxsize = maxsize
+        self.lanes = {}  # lane -> deque of items
+        self.credit = {}  # lane -> picks left in the current round
+        self.n = 0
+
+    def set_weights(self, weights):
+        with self.cond:
+            self.weights = dict(weights)
+            self.credit = {}
+
+    def set_maxsize(self, maxsize):
+        with self.cond:
+            self.maxsize = maxsize
+
+    def qsize(self) -> int:
+        with self.cond:
+            return self.n
+
+    def __len__(self):
+        return self.qsize()
+
+    # never blocks; raises queue.Full if the queue is at maxsize.
+    def put(self, item, lane=INTERACTIVE):
+        with self.cond:
+            if self.maxsize > 0 and self.n >= self.maxsize:
+                raise queue.Full()
+            if lane not in self.lanes:
+                self.lanes[lane] = deque()
+            self.lanes[lane].append(item)
+            self.n += 1
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.n > 0, timeout):
+                raise queue.Empty()
+            return self._pop()
+
+    def get_nowait(self):
+        with self.cond:
+            if self.n == 0:
+                raise queue.Empty()
+            return self._pop()
+
+    def _pop(self):
+        for refill in (False, True):
+            if refill:
+                self.credit = {lane: max(self.weights.get(lane, 1), 1) for lane in self.lanes}
+            for lane in sorted(self.lanes):
+                if self.lanes[lane] and self.credit.get(lane, 0) > 0:
+                    self.credit[lane] -= 1
+                    self.n -= 1
+                    return self.lanes[lane].popleft()
+        raise AssertionError("LaneQueue: no lane to pick from")
@@ -0,0 +1,50 @@
+import threading
+
+from labrpc.lanes import DEFAULT_WEIGHTS
+
+# A point-to-point link between a ClientEnd and its server. A message of
+# n bytes is serialized onto the link at `bandwidth` bytes/second behind
+# whatever is already queued in the same direction, then spends a
+# propagation latency in flight. Requests and replies use independent
+# directions, as on a full-duplex link. Within a direction each priority
+# lane queues separately, and lanes with traffic in flight share the
+# bandwidth in proportion to their weights, so a small request is not
+# stuck behind a multi-megabyte one.
+
+REQUEST = 0
+REPLY = 1
+
+class Link:
+    # latency: seconds, a (lo, hi) range drawn uniformly, or a function
+    #   of a random.Random-like generator returning seconds.
+    # bandwidth: bytes per second, or None for infinitely fast.
+    def __init__(self, latency=0.0, bandwidth=None, weights=None):
+        self.mu = threading.Lock()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.free_at = [{}, {}]  # per direction, lane -> clock time it drains
+
+    def sample_latency(self, rng) -> float:
+        if callable(self.latency):
+            return self.latency(rng)
+        if isinstance(self.latency, tuple):
+            lo, hi = self.latency
+            return rng.uniform(lo, hi)
+        return self.latency
+
+    # reserve the link for an n-byte message sent now and return how long
+    # the sender must wait until it is delivered.
+    def transmit(self, clock, rng, nbytes, direction, lane=0) -> float:
+        latency = self.sample_latency(rng)
+        if not self.bandwidth:
+            return latency
+        with self.mu:
+            now = clock.now()
+            free_at = self.free_at[direction]
+            weight = self.weights.get(lane, 1)
+            busy = sum(self.weights.get(l, 1) for l, t in free_at.items() if l != lane and t > now)
+            rate = self.bandwidth * weight / (weight + busy)
+            start = max(now, free_at.get(lane, 0.0))
+            free_at[lane] = start + nbytes / rate
+            return free_at[lane] - now + latency
@@ -0,0 +1,155 @@
+import collections
+import math
+import random
+import threading
+
+# Per-method and per-end instrumentation for labrpc. Every completed
+# call is broken down into the phases below, each kept as a histogram;
+# a sampled fraction of calls can also be kept verbatim in a trace log.
+# Networks only record once Network.enable_stats() or trace() is called.
+
+PHASES = (
+    "queue",     # waiting in Network.endCh for the network thread
+    "delay",     # injected network delay (virtual seconds in simulation)
+    "dispatch",  # running the service method on the server
+    "encode",    # labgob encode of the args and of the reply
+    "decode",    # labgob decode of the args and of the reply
+    "req_bytes",
+    "reply_bytes",
+)
+
+class Histogram:
+    # log-linear buckets: SUB buckets per power of two, so any recorded
+    # value is reported within ~1/SUB of its true magnitude.
+    SUB = 8
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = collections.Counter()
+
+    def add(self, v):
+        self.count += 1
+        self.sum += v
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+        self.buckets[self.bucket(v)] += 1
+
+    @classmethod
+    def bucket(cls, v):
+        if v <= 0:
+            return (-1075, 0)
+        m, e = math.frexp(v)
+        return (e, int((m - 0.5) * 2 * cls.SUB))
+
+    @classmethod
+    def upper(cls, b):
+        e, sub = b
+        if e == -1075:
+            return 0.0
+        return math.ldexp(0.5 + (sub + 1) / (2 * cls.SUB), e)
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return min(self.upper(b), self.max)
+        return self.max
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.buckets.update(other.buckets)
+
+    def copy(self):
+        h = Histogram()
+        h.merge(self)
+        return h
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+class RpcStats:
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.methods = collections.defaultdict(self._phases)  # svcMeth -> phase -> Histogram
+        self.ends = collections.defaultdict(self._phases)  # endname -> phase -> Histogram
+        self.failed = collections.Counter()  # svcMeth -> calls that got no reply
+        self.sample = 0.0
+        self.log = collections.deque(maxlen=0)
+
+    @staticmethod
+    def _phases():
+        return {phase: Histogram() for phase in PHASES}
+
+    def trace(self, sample: float, maxlen: int = 10000):
+        with self.mu:
+            self.sample = sample
+            self.log = collections.deque(self.log, maxlen=maxlen)
+
+    def record(self, req, rep, encode, decode):
+        sample = {
+            "queue": req.queued,
+            "delay": req.delay,
+            "dispatch": rep.dispatch,
+            "encode": encode + rep.encode,
+            "decode": decode + rep.decode,
+            "req_bytes": len(req.args),
+            "reply_bytes": len(rep.reply),
+        }
+        with self.mu:
+            for phase, v in sample.items():
+                self.methods[req.svcMeth][phase].add(v)
+                self.ends[req.endname][phase].add(v)
+            if self.sample > 0 and random.random() < self.sample:
+                self.log.append(dict(sample, svcMeth=req.svcMeth, endname=req.endname))
+
+    def record_failure(self, req):
+        with self.mu:
+            self.failed[req.svcMeth] += 1
+
+    def forget_end(self, endname):
+        with self.mu:
+            self.ends.pop(endname, None)
+
+    def by_method(self):
+        with self.mu:
+            return {m: {p: h.copy() for p, h in phases.items()} for m, phases in self.methods.items()}
+
+    def by_end(self):
+        with self.mu:
+            return {e: {p: h.copy() for p, h in phases.items()} for e, phases in self.ends.items()}
+
+    def trace_log(self):
+        with self.mu:
+            return list(self.log)
+
+    def report(self) -> str:
+        lines = [f"{'method':<24} {'phase':<12} {'count':>7} {'mean':>12} {'p50':>12} {'p99':>12} {'max':>12}"]
+        methods = self.by_method()
+        with self.mu:
+            failed = dict(self.failed)
+        for m in sorted(methods):
+            for p in PHASES:
+                s = methods[m][p].summary()
+                lines.append(f"{m:<24} {p:<12} {s['count']:>7} {s['mean']:>12.6g} {s['p50']:>12.6g} {s['p99']:>12.6g} {s['max']:>12.6g}")
+            if failed.get(m):
+                lines.append(f"{m:<24} {'failed':<12} {failed[m]:>7}")
+        return "\n".join(lines)
@@ -5,12 +5,16 @@ from collections import defaultdict
 from porcupine.model import Model
 
 class KvInput:
+    __slots__ = ("op", "key", "value")
+
     def __init__(self, op, key, value=None):
         self.op = op  # 0 => get, 1 => put, 2 => append
         self.key = key
         self.value = value
 
 class KvOutput:
+    __slots__ = ("value",)
+
     def __init__(self, value=None):
         self.value = value
 
@@ -24,10 +28,103 @@ def partition(history):
     ret = [m[k] for k in keys]
     return ret
 
+def partition_key(input):
+    return input.key
+
+# A key's value, kept as the sequence of writes that produced it: a put
+# (or the initial ""), then appends. States live in a trie rooted at the
+# initial state, so the same sequence of writes always yields the same
+# object, and the checker compares and hashes states in O(1) by identity,
+# rather than copying and comparing ever longer strings on each append.
+# The string itself is only built, once per state, when an output has to
+# be checked against it.
+#
+# Two different write sequences with the same result ("a" + "bc" and
+# "ab" + "c") are different states. That costs the checker some cache
+# hits, but never a wrong answer.
+class KvState:
+    __slots__ = ("parent", "piece", "length", "root", "children", "value")
+
+    def __init__(self, parent, piece):
+        self.parent = parent
+        self.piece = piece
+        self.length = len(piece) + (parent.length if parent else 0)
+        self.root = parent.root if parent else self
+        self.children = None  # piece -> KvState, created on first append
+        self.value = None if parent else piece  # the string, once built
+
+    def append(self, piece):
+        if not piece:
+            return self
+        if self.children is None:
+            self.children = {}
+        child = self.children.get(piece)
+        if child is None:
+            child = self.children[piece] = KvState(self, piece)
+        return child
+
+    def put(self, value):
+        return self.root.append(value)
+
+    def string(self):
+        if self.value is None:
+            pieces = []
+            node = self
+            while node.value is None:
+                pieces.append(node.piece)
+                node = node.parent
+            pieces.append(node.value)
+            pieces.reverse()
+            self.value = "".join(pieces)
+        return self.value
+
+    # whether s is exactly this state's value. The length check rejects
+    # most mismatches outright. Otherwise s is compared piece by piece, in
+    # place, back to the nearest state whose string is known, and on a
+    # match s itself becomes this state's string, so outputs are never
+    # copied and every later check of this state is one comparison.
+    def matches(self, s):
+        if type(s) is not str or len(s) != self.length:
+            return False
+        if self.value is not None:
+            return s == self.value
+        node = self
+        end = len(s)
+        while node.value is None:
+            end -= len(node.piece)
+            if not s.startswith(node.piece, end):
+                return False
+            node = node.parent
+        if not s.startswith(node.value):
+            return False
+        self.value = s
+        return True
+
+    def __str__(self):
+        return self.string()
+
+    def __repr__(self):
+        return f"KvState({self.string()!r})"
+
 def init():
     # Note: we are modeling a single key's value here;
     # we're partitioning by key, so this is okay
-    return ""
+    return KvState(None, "")
+
+# the same values as states, in a trie of their own, so an online
+# checker that keeps only these frees every state explored on the way to
+# them. They share one root, so states with the same string become one
+# state, and a later put from any of them reaches the same state.
+def compact_states(states):
+    root = KvState(None, "")
+    out = []
+    for state in states:
+        s = state.string()
+        state = root.append(s)
+        if state is not root:
+            state.value = s
+        out.append(state)
+    return out
 
 def step(state, input, output):
     inp = input
@@ -35,16 +132,16 @@ def step(state, input, output):
     st = state
     if inp.op == 0:
         # get
-        return out.value == st, state
+        return st.matches(out.value), state
     elif inp.op == 1:
         # put
-        return True, inp.value
+        return True, st.put(inp.value)
     elif inp.op == 2:
         # append
-        return True, (st + inp.value)
+        return True, st.append(inp.value)
     else:
         # append with return value
-        return out.value == st, (st + inp.value)
+        return st.matches(out.value), st.append(inp.value)
 
 def describe_operation(input, output):
     inp = input
@@ -62,5 +159,7 @@ KvModel = Model(
     partition=partition,
     init=init,
     step=step,
-    describe_operation=describe_operation
+    describe_operation=describe_operation,
+    partition_key=partition_key,
+    compact_states=compact_states
 )
@@ -0,0 +1,204 @@
+import argparse
+import sys
+import time
+import zlib
+from typing import Iterator, List
+
+from labgob.varint import varint, read_varint, zigzag, unzigzag
+from porcupine.model import Operation
+from porcupine import checker
+from models.kv import KvInput, KvOutput, KvModel
+
+# A compact file format for KV histories, so a run can be recorded and
+# checked, or rechecked, later:
+#
+#   python -m models.kvhistory run.kvh --timeout 600
+#
+# A file is MAGIC followed by a zlib stream of records, one per operation,
+# in the order they were written:
+#
+#   client id, op, key, input value, output value, call time, duration
+#
+# Ops are varints. Client ids and durations are zigzag varints, since
+# the harness logs some operations as client -1 and a skewed clock can
+# put a response before its call; the call time is a zigzag varint delta
+# from the previous record's, since operations are written as they
+# complete, not as they start. Strings are references:
+#
+#   0            None
+#   1, len, utf8 a new string; if it is at most INTERN_MAX bytes and
+#                the table has fewer than STRINGS_MAX entries, it also
+#                gets the next index in the file's string table
+#   i + 2        string table entry i
+#
+# so keys and appended values are written once, and the long values
+# returned by gets are left to zlib. The cap keeps a long run's table,
+# on both ends, from growing with every distinct value; strings past it
+# are written out in full each time, which zlib still shortens.
+
+MAGIC = b"KVH3"
+INTERN_MAX = 256
+STRINGS_MAX = 1 << 16
+FLUSH_EVERY = 1 << 16  # bytes of records between zlib flushes
+
+# Not safe for concurrent use; OpLog serializes its appends.
+class HistoryWriter:
+    def __init__(self, path: str):
+        self.f = open(path, "wb")
+        self.f.write(MAGIC)
+        self.z = zlib.compressobj(6)
+        self.strings = {}  # str -> index
+        self.last_call = 0
+        self.buf = []
+        self.nbuf = 0
+        self.count = 0
+
+    def string(self, s):
+        if s is None:
+            return b"\x00"
+        i = self.strings.get(s)
+        if i is not None:
+            return varint(i + 2)
+        b = s.encode()
+        if len(b) <= INTERN_MAX and len(self.strings) < STRINGS_MAX:
+            self.strings[s] = len(self.strings)
+        return b"\x01" + varint(len(b)) + b
+
+    def write(self, op: Operation):
+        inp, out = op.input, op.output
+        rec = b"".join((
+            varint(zigzag(op.client_id)),
+            varint(inp.op),
+            self.string(inp.key),
+            self.string(inp.value),
+            self.string(out.value),
+            varint(zigzag(op.call_time - self.last_call)),
+            varint(zigzag(op.response_time - op.call_time)),
+        ))
+        self.last_call = op.call_time
+        self.buf.append(rec)
+        self.nbuf += len(rec)
+        self.count += 1
+        if self.nbuf >= FLUSH_EVERY:
+            self.flush()
+
+    # writes out everything so far, so a crashed run still leaves a
+    # readable prefix
+    def flush(self):
+        data = b"".join(self.buf)
+        self.buf = []
+        self.nbuf = 0
+        self.f.write(self.z.compress(data) + self.z.flush(zlib.Z_SYNC_FLUSH))
+        self.f.flush()
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.flush()
+        self.f.write(self.z.flush())
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+
+    def varint(self) -> int:
+        b = self.data[self.pos]
+        if b < 0x80:
+            self.pos += 1
+            return b
+        n, self.pos = read_varint(self.data, self.pos)
+        return n
+
+    def string(self):
+        ref = self.varint()
+        if ref == 0:
+            return None
+        if ref > 1:
+            return self.strings[ref - 2]
+        n = self.varint()
+        if self.pos + n > len(self.data):
+            raise IndexError("string continues past the data")
+        b = self.data[self.pos:self.pos + n]
+        self.pos += n
+        s = b.decode()
+        if n <= INTERN_MAX and len(self.strings) < STRINGS_MAX:
+            self.strings.append(s)
+        return s
+
+def read_history(path: str) -> Iterator[Operation]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a KV history file")
+        z = zlib.decompressobj()
+        r = Reader(b"")
+        call = 0
+        while True:
+            chunk = f.read(1 << 20)
+            # keep any partial record left over from the last chunk
+            r.data = r.data[r.pos:] + (z.decompress(chunk) if chunk else z.flush())
+            r.pos = 0
+            while r.pos < len(r.data):
+                start = r.pos
+                nstrings = len(r.strings)
+                try:
+                    client_id = unzigzag(r.varint())
+                    opcode = r.varint()
+                    key = r.string()
+                    value = r.string()
+                    output = r.string()
+                    call += unzigzag(r.varint())
+                    duration = unzigzag(r.varint())
+                except IndexError:
+                    # the record continues in the next chunk, or, at the
+                    # end of a file cut short by a crash, nowhere
+                    r.pos = start
+                    del r.strings[nstrings:]
+                    break
+                yield Operation(client_id, KvInput(opcode, key, value), call, KvOutput(output), call + duration)
+            if not chunk:
+                return
+
+def write_history(path: str, history: List[Operation]):
+    with HistoryWriter(path) as w:
+        for op in history:
+            w.write(op)
+
+def main():
+    parser = argparse.ArgumentParser(description="check recorded KV histories for linearizability")
+    parser.add_argument("files", nargs="+", help="histories written by HistoryWriter")
+    parser.add_argument("--timeout", type=float, default=0, help="seconds per file; 0 for no limit")
+    parser.add_argument("--backend", choices=("thread", "process"), default="thread", help="check partitions in threads or in worker processes")
+    parser.add_argument("--workers", type=int, default=None, help="processes for the process backend (default: one per core)")
+    parser.add_argument("--heuristic", choices=sorted(checker.HEURISTICS), default=checker.DEFAULT_HEURISTIC, help="search order")
+    args = parser.parse_args()
+
+    status = 0
+    for path in args.files:
+        t0 = time.monotonic()
+        history = list(read_history(path))
+        loaded = time.monotonic() - t0
+        # this process only checks, so the collector can be tuned for it
+        res, info = checker.check_operations(KvModel, history, True, args.timeout, args.backend, args.workers, args.heuristic,
+                                             quiet_gc=True)
+        print(f"{path}: {res} ({len(history)} ops, {len(info.progress)} keys, "
+              f"loaded in {loaded:.2f}s, checked in {time.monotonic() - t0 - loaded:.2f}s)")
+        for p in info.progress:
+            if not p.done:
+                print(f"  unfinished: {p}")
+        if res == "Illegal":
+            status = 1
+        elif res == "Unknown" and status == 0:
+            status = 2
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
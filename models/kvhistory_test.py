@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from porcupine.model import Operation
+from porcupine.histories import kv_history, garbled
+from models import kvhistory
+from models.kv import KvInput, KvOutput
+
+class TestHistoryFile(unittest.TestCase):
+    def test_roundtrip(self):
+        history = kv_history(3000, nclients=4, nkeys=3, seed=4)
+        history.append(Operation(7, KvInput(op=1, key="ключ", value="x" * 1000), 5, KvOutput(), 10 ** 12))
+        history.append(Operation(0, KvInput(op=0, key="k"), 0, KvOutput(value=None), 1))
+        history.append(Operation(-1, KvInput(op=0, key="k"), 3, KvOutput(value="v"), 2))
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "h.kvh")
+            kvhistory.write_history(path, history)
+            fields = lambda op: (op.client_id, op.input.op, op.input.key, op.input.value, op.output.value, op.call_time, op.response_time)
+            self.assertEqual([fields(op) for op in kvhistory.read_history(path)], [fields(op) for op in history])
+
+            # a file cut short, as by a crash, still yields the ops flushed before it
+            w = kvhistory.HistoryWriter(path)
+            for op in history:
+                w.write(op)
+            w.flush()
+            w.f.close()
+            self.assertEqual(len(list(kvhistory.read_history(path))), len(history))
+
+    def test_string_table_cap(self):
+        history = kv_history(2000, nclients=4, nkeys=3, seed=5)
+        with tempfile.TemporaryDirectory() as d, mock.patch.object(kvhistory, "STRINGS_MAX", 10):
+            path = os.path.join(d, "h.kvh")
+            with kvhistory.HistoryWriter(path) as w:
+                for op in history:
+                    w.write(op)
+                self.assertEqual(len(w.strings), 10)
+            fields = lambda op: (op.client_id, op.input.key, op.input.value, op.output.value)
+            self.assertEqual([fields(op) for op in kvhistory.read_history(path)], [fields(op) for op in history])
+
+    def test_cli(self):
+        history = kv_history(500, nclients=4, nkeys=2, seed=6)
+        with tempfile.TemporaryDirectory() as d:
+            good = os.path.join(d, "good.kvh")
+            bad = os.path.join(d, "bad.kvh")
+            kvhistory.write_history(good, history)
+            kvhistory.write_history(bad, garbled(history))
+            for files, status in (([good], 0), ([good, bad], 1)):
+                with mock.patch.object(sys, "argv", ["kvhistory", "--backend", "thread", *files]), \
+                     mock.patch("sys.stdout"), self.assertRaises(SystemExit) as cm:
+                    kvhistory.main()
+                self.assertEqual(cm.exception.code, status)
@@ -0,0 +1,290 @@
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import threading
+import time
+
+# A performance regression gate. It runs a fixed set of benchmarks over
+# the KV store, labrpc, labgob and porcupine hot paths several times,
+# and compares the medians with a stored baseline. Run from the
+# repository root:
+#
+#   python -m perf_gate --save baseline.json        # on the old code
+#   python -m perf_gate --baseline baseline.json    # on the new code
+#   python -m perf_gate --baseline old.json --current new.json
+#
+# Exits 1 if any metric regressed, or if a baseline metric is missing
+# from the current run and --only did not leave out its group. A metric
+# regresses when its median is worse than the baseline's by more than
+# both --tolerance (relative) and --noise times the larger of the two
+# runs' scaled MAD (median absolute deviation), so one noisy run neither
+# trips the gate nor hides a real change. Deterministic metrics, like RPCs per op or search
+# steps, have no spread and are held to --tolerance alone.
+#
+# Timings only compare on the same machine, so baselines are not
+# checked in: save one before a change and compare after it. Even then a
+# shared or throttled machine can run everything 50% slower for a while,
+# so before each group a fixed pure-Python loop is timed too, and the
+# times and rates of CPU-bound metrics are scaled by how much slower or
+# faster that loop got (--no-calibrate to compare raw numbers). The KV
+# store's latencies and throughput are mostly labrpc's injected delays
+# and the clients' sleeps, which a slower CPU does not stretch, so they
+# are compared raw: scaling them would let a slow machine hide a
+# regression.
+
+VERSION = 2
+MAD_SCALE = 1.4826  # makes the MAD estimate a normal distribution's sigma
+TIME_UNITS = {"s", "ms", "us"}  # scaled down on a slower machine; rates up
+
+# Each benchmark returns {metric: (value, better, unit, calibrate)},
+# where better is "lower" or "higher" and calibrate says whether the
+# metric is CPU-bound enough to scale by the calibration loop.
+
+# interpreter work with no I/O, locks or allocation growth: method
+# calls, dict and string operations, like the hot paths below
+def calibrate(n=100000):
+    t0 = time.perf_counter()
+    d = {}
+    for i in range(n):
+        k = str(i % 512)
+        d[k] = d.get(k, "")[-16:] + k
+    return time.perf_counter() - t0
+
+def bench_kv():
+    import kv_bench
+    w = kv_bench.Workload(keys=1000, **kv_bench.WORKLOADS["a"])
+    r = kv_bench.run_workload(w, nclients=8, duration=2.0, warmup=0.5, nshards=3)
+    lat = r["latency"]["all"]
+    return {
+        "kv.throughput": (r["throughput"], "higher", "ops/s", False),
+        "kv.p50": (lat["p50_ms"], "lower", "ms", False),
+        "kv.p95": (lat["p95_ms"], "lower", "ms", False),
+        "kv.p99": (lat["p99_ms"], "lower", "ms", False),
+        "kv.rpcs_per_op": (r["nrpc"] / r["issued"], "lower", "rpcs", False),
+        "kv.bytes_per_op": (r["bytes"] / r["issued"], "lower", "bytes", False),
+    }
+
+class Echo:
+    def echo(self, args):
+        return args
+
+def bench_labrpc(ncalls=2000, nthreads=8):
+    from labrpc.labrpc import Network, Server, Service
+    rn = Network()
+    try:
+        srv = Server()
+        srv.add_service(Service(Echo()))
+        rn.add_server("echo", srv)
+        ends = []
+        for i in range(nthreads):
+            e = rn.make_end(f"end{i}")
+            rn.connect(f"end{i}", "echo")
+            rn.enable(f"end{i}", True)
+            ends.append(e)
+        args = "x" * 64
+
+        t0 = time.perf_counter()
+        for _ in range(ncalls):
+            ends[0].call("Echo.echo", args)
+        one = (time.perf_counter() - t0) / ncalls * 1e6
+
+        bytes0 = rn.get_total_bytes()
+        def caller(e):
+            for _ in range(ncalls // nthreads):
+                e.call("Echo.echo", args)
+        threads = [threading.Thread(target=caller, args=(e,)) for e in ends]
+        t0 = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        many = ncalls // nthreads * nthreads / (time.perf_counter() - t0)
+        per_call = (rn.get_total_bytes() - bytes0) / (ncalls // nthreads * nthreads)
+    finally:
+        rn.cleanup()
+    return {
+        "labrpc.call": (one, "lower", "us", True),
+        f"labrpc.calls_{nthreads}_threads": (many, "higher", "calls/s", True),
+        "labrpc.bytes_per_call": (per_call, "lower", "bytes", False),
+    }
+
+def bench_labgob():
+    from labgob import labgob_bench
+    out = {}
+    for size in (16, 64 * 1024):
+        for name in ("PutAppendArgs", "GetReply"):
+            msg = labgob_bench.kv_messages(size)[name]
+            m = labgob_bench.measure(msg, budget=0.02, repeat=3)
+            out[f"labgob.{name}_{size}.encode"] = (m["encode_us"], "lower", "us", True)
+            out[f"labgob.{name}_{size}.decode"] = (m["decode_us"], "lower", "us", True)
+            out[f"labgob.{name}_{size}.bytes"] = (m["bytes"], "lower", "bytes", False)
+    return out
+
+def bench_porcupine():
+    from porcupine import porcupine_bench
+    from porcupine.histories import kv_history, adversarial_history
+    out = {}
+    for scenario in ("wide", "get_heavy"):
+        history = kv_history(1000, **porcupine_bench.SCENARIOS[scenario])
+        for mode in ("fits_state", "split"):
+            t0 = time.perf_counter()
+            _, total = porcupine_bench.run_mode(mode, history, timeout=60)
+            out[f"porcupine.{scenario}.{mode}"] = (time.perf_counter() - t0, "lower", "s", True)
+            out[f"porcupine.{scenario}.{mode}.steps"] = (total.steps, "lower", "steps", False)
+    t0 = time.perf_counter()
+    _, total = porcupine_bench.run_mode("fits_state", adversarial_history(7), timeout=60)
+    out["porcupine.adversarial"] = (time.perf_counter() - t0, "lower", "s", True)
+    out["porcupine.adversarial.steps"] = (total.steps, "lower", "steps", False)
+    return out
+
+BENCHMARKS = {
+    "kv": bench_kv,
+    "labrpc": bench_labrpc,
+    "labgob": bench_labgob,
+    "porcupine": bench_porcupine,
+}
+
+def mad(xs) -> float:
+    m = statistics.median(xs)
+    return statistics.median(abs(x - m) for x in xs)
+
+# runs every group runs times, interleaved, so a slow patch of the
+# machine's time spreads over all metrics rather than skewing one.
+def run_benchmarks(groups=None, runs=5, log=None) -> dict:
+    groups = groups or list(BENCHMARKS)
+    metrics = {}
+    for i in range(runs):
+        for g in groups:
+            if log:
+                print(f"run {i + 1}/{runs}: {g}", file=log)
+            cal = metrics.setdefault("calibration", {"better": "lower", "unit": "s", "calibrate": False, "samples": []})
+            cal["samples"].append(min(calibrate() for _ in range(3)))
+            for name, (value, better, unit, scale) in BENCHMARKS[g]().items():
+                m = metrics.setdefault(name, {"better": better, "unit": unit, "calibrate": scale, "samples": []})
+                m["samples"].append(value)
+    for m in metrics.values():
+        m["median"] = statistics.median(m["samples"])
+        m["mad"] = mad(m["samples"])
+    return {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": runs,
+        "groups": groups,
+        "metrics": metrics,
+    }
+
+# current's CPU-bound metrics as if measured on a machine as fast as
+# baseline's, going by their calibration medians
+def calibrated(baseline: dict, current: dict) -> dict:
+    b, c = baseline["metrics"].get("calibration"), current["metrics"].get("calibration")
+    if not b or not c or not c["median"]:
+        return current["metrics"]
+    slower = c["median"] / b["median"]
+    out = {}
+    for name, m in current["metrics"].items():
+        if not m["calibrate"]:
+            out[name] = m
+            continue
+        if m["unit"] in TIME_UNITS:
+            f = 1 / slower
+        elif m["unit"].endswith("/s"):
+            f = slower
+        else:
+            f = 1
+        out[name] = dict(m, samples=[x * f for x in m["samples"]], median=m["median"] * f, mad=m["mad"] * f)
+    return out
+
+# one row per metric in either result. change is relative to the
+# baseline and positive when the metric got worse. The calibration row
+# shows how much slower the machine ran; it is never a regression.
+def compare(baseline: dict, current: dict, tolerance=0.15, noise=3.0, calibrate=True) -> list:
+    rows = []
+    base = baseline["metrics"]
+    cur = calibrated(baseline, current) if calibrate else current["metrics"]
+    for name in sorted(set(base) | set(cur)):
+        row = {"metric": name, "baseline": None, "current": None, "change": None}
+        if name not in cur:
+            row.update(status="missing", baseline=base[name]["median"], unit=base[name]["unit"])
+            rows.append(row)
+            continue
+        c = cur[name]
+        row.update(current=c["median"], unit=c["unit"])
+        if name not in base:
+            row["status"] = "new"
+            rows.append(row)
+            continue
+        b = base[name]
+        row["baseline"] = b["median"]
+        worse = c["median"] - b["median"] if b["better"] == "lower" else b["median"] - c["median"]
+        threshold = max(tolerance * abs(b["median"]), noise * MAD_SCALE * max(b["mad"], c["mad"]))
+        row["change"] = worse / abs(b["median"]) if b["median"] else (math.inf if worse > 0 else 0.0)
+        row["threshold"] = threshold
+        if name == "calibration":
+            row["status"] = "machine"
+        elif worse > threshold:
+            row["status"] = "regressed"
+        elif -worse > threshold:
+            row["status"] = "improved"
+        else:
+            row["status"] = "ok"
+        rows.append(row)
+    return rows
+
+def print_comparison(rows, out=sys.stdout):
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'unit':>8} {'change':>8}  status", file=out)
+    for r in rows:
+        fmt = lambda v: f"{v:>12.4g}" if v is not None else f"{'-':>12}"
+        change = f"{r['change']:>+8.1%}" if r["change"] is not None else f"{'':>8}"
+        print(f"{r['metric']:<40} {fmt(r['baseline'])} {fmt(r['current'])} {r['unit']:>8} {change}  {r['status']}", file=out)
+
+def load(path) -> dict:
+    with open(path) as f:
+        results = json.load(f)
+    if results.get("version") != VERSION:
+        raise ValueError(f"{path}: results version {results.get('version')}, expecting {VERSION}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="performance regression gate")
+    parser.add_argument("--baseline", metavar="FILE", help="results to compare against")
+    parser.add_argument("--current", metavar="FILE", help="compare these results instead of running the benchmarks")
+    parser.add_argument("--save", metavar="FILE", help="write this run's results, e.g. as a new baseline")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None, help="benchmark groups to run (default: all)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change always allowed")
+    parser.add_argument("--noise", type=float, default=3.0, help="allowed change in scaled MADs")
+    parser.add_argument("--no-calibrate", dest="calibrate", action="store_false", help="do not scale times by machine speed")
+    args = parser.parse_args()
+    if not args.baseline and not args.save:
+        parser.error("nothing to do: give --baseline, --save or both")
+
+    if args.current:
+        current = load(args.current)
+    else:
+        baseline_groups = load(args.baseline)["groups"] if args.baseline and not args.only else None
+        current = run_benchmarks(args.only or baseline_groups, args.runs, log=sys.stderr)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+    if not args.baseline:
+        return
+
+    rows = compare(load(args.baseline), current, args.tolerance, args.noise, args.calibrate)
+    if args.only:
+        prefixes = tuple(g + "." for g in args.only) + ("calibration",)
+        rows = [r for r in rows if r["metric"].startswith(prefixes)]
+    print_comparison(rows)
+    # a metric that stopped being measured hides whatever it covered
+    failed = [r["metric"] for r in rows if r["status"] in ("regressed", "missing")]
+    if failed:
+        nmissing = sum(r["status"] == "missing" for r in rows)
+        print(f"FAIL: {len(failed) - nmissing} regressed, {nmissing} missing: {', '.join(failed)}")
+        sys.exit(1)
+    print("ok")
+
+if __name__ == "__main__":
+    main()
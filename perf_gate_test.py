@@ -0,0 +1,88 @@
+import json
+import os
+import statistics
+import tempfile
+import unittest
+from unittest import mock
+
+import perf_gate
+
+# Test: the regression gate flags real slowdowns, not noise or a slow machine
+class TestPerfGate(unittest.TestCase):
+    def test_perf_gate(self):
+        def results(**metrics):
+            out = {}
+            for name, (samples, better, unit, calibrate) in metrics.items():
+                out[name] = {"better": better, "unit": unit, "calibrate": calibrate, "samples": samples,
+                             "median": statistics.median(samples), "mad": perf_gate.mad(samples)}
+            return {"version": perf_gate.VERSION, "groups": ["kv"], "metrics": out}
+
+        def status(base, cur, **kw):
+            return {r["metric"]: r["status"] for r in perf_gate.compare(base, cur, **kw)}
+
+        base = results(calibration=([1.0, 1.0, 1.0], "lower", "s", False),
+                       t=([10, 11, 10], "lower", "s", True),
+                       noisy=([10, 4, 16], "lower", "s", True),
+                       rate=([100, 101, 99], "higher", "ops/s", True),
+                       steps=([50, 50, 50], "lower", "steps", False),
+                       lat=([10, 10.2, 9.8], "lower", "ms", False))
+        self.assertEqual(set(status(base, base).values()), {"ok", "machine"})
+
+        worse = results(calibration=([1.0, 1.0, 1.0], "lower", "s", False),
+                        t=([20, 21, 20], "lower", "s", True),
+                        noisy=([13, 6, 19], "lower", "s", True),
+                        rate=([50, 51, 49], "higher", "ops/s", True),
+                        steps=([60, 60, 60], "lower", "steps", False),
+                        lat=([10, 10.2, 9.8], "lower", "ms", False),
+                        added=([1, 1, 1], "lower", "s", True))
+        self.assertEqual(status(base, worse), {"calibration": "machine", "t": "regressed", "noisy": "ok",
+                                               "rate": "regressed", "steps": "regressed", "lat": "ok", "added": "new"})
+
+        # everything twice as slow, on a machine twice as slow
+        slow = results(calibration=([2.0, 2.0, 2.0], "lower", "s", False),
+                       t=([20, 22, 20], "lower", "s", True),
+                       noisy=([20, 8, 32], "lower", "s", True),
+                       rate=([50, 50.5, 49.5], "higher", "ops/s", True),
+                       steps=([50, 50, 50], "lower", "steps", False),
+                       lat=([10, 10.2, 9.8], "lower", "ms", False))
+        self.assertEqual(set(status(base, slow).values()), {"ok", "machine"})
+        self.assertEqual(status(base, slow, calibrate=False)["t"], "regressed")
+
+        # latency that is mostly injected delay is not scaled, so a slow
+        # machine neither hides its regressions nor turns them into gains
+        slow_lat = dict(slow, metrics=dict(slow["metrics"], **results(lat=([16, 16.2, 15.8], "lower", "ms", False))["metrics"]))
+        self.assertEqual(status(base, slow_lat)["lat"], "regressed")
+
+        with tempfile.TemporaryDirectory() as d:
+            paths = {}
+            for name, r in (("base", base), ("worse", worse), ("slow", slow)):
+                paths[name] = os.path.join(d, name + ".json")
+                with open(paths[name], "w") as f:
+                    json.dump(r, f)
+            argv = ["perf_gate", "--baseline", paths["base"], "--current", paths["slow"]]
+            with mock.patch("sys.argv", argv):
+                perf_gate.main()
+            argv[-1] = paths["worse"]
+            with mock.patch("sys.argv", argv), self.assertRaises(SystemExit) as cm:
+                perf_gate.main()
+            self.assertEqual(cm.exception.code, 1)
+
+            # a metric dropped from the run fails the gate, unless --only
+            # left its group out
+            grouped = results(**{"kv.t": ([10, 10, 10], "lower", "s", True), "labrpc.call": ([5, 5, 5], "lower", "us", True)})
+            partial = results(**{"kv.t": ([10, 10, 10], "lower", "s", True)})
+            for name, r in (("grouped", grouped), ("partial", partial)):
+                paths[name] = os.path.join(d, name + ".json")
+                with open(paths[name], "w") as f:
+                    json.dump(r, f)
+            self.assertEqual(status(grouped, partial)["labrpc.call"], "missing")
+            argv = ["perf_gate", "--baseline", paths["grouped"], "--current", paths["partial"]]
+            with mock.patch("sys.argv", argv), self.assertRaises(SystemExit) as cm:
+                perf_gate.main()
+            self.assertEqual(cm.exception.code, 1)
+            with mock.patch("sys.argv", argv + ["--only", "kv"]):
+                perf_gate.main()
+
+        r = perf_gate.run_benchmarks(["labrpc"], runs=1)
+        self.assertEqual(r["metrics"]["labrpc.bytes_per_call"]["median"], r["metrics"]["labrpc.bytes_per_call"]["samples"][0])
+        self.assertIn("calibration", r["metrics"])
@@ -57,3 +57,53 @@ class BitSet:
                 return False
         return True
 
+    # whether self equals other with pos set, without copying other
+    def equals_with(self, other, pos: int) -> bool:
+        if len(self.data) != len(other.data):
+            return False
+        major, minor = self.bitset_index(pos)
+        for i in range(len(self.data)):
+            v = other.data[i] | (1 << minor) if i == major else other.data[i]
+            if self.data[i] != v:
+                return False
+        return True
+
+
+# The same interface backed by a single Python int: set and clear are one
+# big-int operation, popcnt is int.bit_count(), and hashing, equality and
+# clone() run in C instead of looping over chunks in Python.
+class IntBitSet:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        # bits is the capacity, kept for interface compatibility with BitSet;
+        # an int grows as needed
+        self.bits = 0
+
+    def clone(self):
+        bitset = IntBitSet.__new__(IntBitSet)
+        bitset.bits = self.bits
+        return bitset
+
+    def set(self, pos: int):
+        self.bits |= 1 << pos
+        return self
+
+    def clear(self, pos: int):
+        self.bits &= ~(1 << pos)
+        return self
+
+    def get(self, pos: int) -> bool:
+        return (self.bits >> pos) & 1 == 1
+
+    def popcnt(self) -> int:
+        return self.bits.bit_count()
+
+    def hash(self) -> int:
+        return hash(self.bits)
+
+    def equals(self, other) -> bool:
+        return self.bits == other.bits
+
+    def equals_with(self, other, pos: int) -> bool:
+        return self.bits == other.bits | 1 << pos
@@ -1,11 +1,21 @@
+import gc
+import multiprocessing
+import os
+import random
 import threading
 import time
-from typing import List, Tuple, Any, Dict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, CancelledError, as_completed
+# before 3.11, as_completed raises this, not the builtin TimeoutError
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import List, Tuple, Any
 
 from porcupine.model import *
-from porcupine.bitset import BitSet
+from porcupine.bitset import IntBitSet
 
 class Entry:
+    __slots__ = ("is_return", "value", "id", "time", "client_id")
+
     def __init__(self, is_return: bool, value: Any, id: int, time: int, client_id: int):
         self.is_return = is_return
         self.value = value
@@ -14,9 +24,10 @@ class Entry:
         self.client_id = client_id
 
 class LinearizationInfo:
-    def __init__(self, history: List[List[Entry]], partial_linearizations: List[List[List[int]]]):
+    def __init__(self, history: List[List[Entry]], partial_linearizations: List[List[List[int]]], progress: List["Progress"] = None):
         self.history = history
         self.partial_linearizations = partial_linearizations
+        self.progress = progress or []  # one per partition
 
 class ByTime:
     def __init__(self, entries: List[Entry]):
@@ -32,20 +43,23 @@ class ByTime:
         self.entries[idx] = value
 
     def sort(self):
-        self.entries.sort(key=lambda e: (e.time, not e.is_return and 0 or 1))
+        # calls before returns at the same instant, so ops that touch
+        # count as concurrent
+        self.entries.sort(key=lambda e: (e.time, 1 if e.is_return else 0))
 
 def make_entries(history: List[Operation]) -> List[Entry]:
     entries = []
-    id_counter = 0
-    for elem in history:
-        entries.append(Entry(False, elem.input, id_counter, elem.call_time, elem.client_id))
-        entries.append(Entry(True, elem.output, id_counter, elem.response_time, elem.client_id))
-        id_counter += 1
+    append = entries.append
+    for id, elem in enumerate(history):
+        append(Entry(False, elem.input, id, elem.call_time, elem.client_id))
+        append(Entry(True, elem.output, id, elem.response_time, elem.client_id))
     entries_by_time = ByTime(entries)
     entries_by_time.sort()
     return entries
 
 class Node:
+    __slots__ = ("value", "match", "id", "next", "prev")
+
     def __init__(self, value, match, id, next_node = None, prev_node = None):
         self.value = value
         self.match = match  # Call if match is None, otherwise Return
@@ -76,7 +90,7 @@ def renumber(events: List[Event]) -> List[Event]:
     id_counter = 0
     for v in events:
         if v.event_id in m:
-            e.append(Event(v.client_id, v.is_return, v.value, m[v.Id]))
+            e.append(Event(v.client_id, v.is_return, v.value, m[v.event_id]))
         else:
             e.append(Event(v.client_id, v.is_return, v.value, id_counter))
             m[v.event_id] = id_counter
@@ -90,40 +104,59 @@ def convert_entries(events: List[Event]) -> List[Entry]:
         if elem.is_return:
             is_return = True
         # Use index as "time"
-        entries.append(Entry(is_return, elem.value, elem.id, i, elem.client_id))
+        entries.append(Entry(is_return, elem.value, elem.event_id, i, elem.client_id))
     return entries
 
 def make_linked_entries(entries: List[Entry]) -> Node:
     root = None
     match = {}
-    for i in range(len(entries) - 1, -1, -1):
-        elem = entries[i]
+    # built back to front, each node going in at the head: this is
+    # insert_before(entry_node, root), inlined
+    for elem in reversed(entries):
         if elem.is_return:
-            entry_node = Node(elem.value, None, elem.id)
+            entry_node = Node(elem.value, None, elem.id, root)
             match[elem.id] = entry_node
-            insert_before(entry_node, root)
-            root = entry_node
         else:
-            entry_node = Node(elem.value, match[elem.id], elem.id)
-            insert_before(entry_node, root)
-            root = entry_node
+            entry_node = Node(elem.value, match.pop(elem.id), elem.id, root)
+        if root:
+            root.prev = entry_node
+        root = entry_node
     return root
 
 class CacheEntry:
+    __slots__ = ("linearized", "state")
+
     def __init__(self, linearized, state):
         self.linearized = linearized
         self.state = state
 
-def cache_contains(model: Model, cache: Dict[int, List[CacheEntry]], entry: CacheEntry) -> bool:
-    for elem in cache.get(entry.linearized.hash(), []):
-        if entry.linearized.equals(elem.linearized) and model.Equal(entry.state, elem.state):
+# whether bucket holds (linearized plus op pos, state), checked without
+# building that set
+def cache_contains(model: Model, bucket: List[CacheEntry], linearized, pos: int, state: Any) -> bool:
+    for elem in bucket:
+        if elem.linearized.equals_with(linearized, pos) and model.equal(state, elem.state):
             return True
     return False
 
+# Zobrist hashing: each op gets a random 64-bit key, and the hash of a
+# linearized set is the XOR of its members' keys, so adding or removing
+# one op updates the hash in O(1) instead of rehashing the whole bitset.
+# Seeded, so a search is reproducible.
+@lru_cache(maxsize=64)
+def zobrist_keys(n: int) -> List[int]:
+    rng = random.Random(n)
+    return [rng.getrandbits(64) for _ in range(n)]
+
 class CallsEntry:
-    def __init__(self, entry: Node, state: Any):
+    __slots__ = ("entry", "state", "candidates", "next")
+
+    def __init__(self, entry: Node, state: Any, candidates: List[Node], next: int):
         self.entry = entry
         self.state = state
+        # where to pick up on backtracking: the candidates entry was
+        # chosen from, and the index of the one to try after it
+        self.candidates = candidates
+        self.next = next
 
 def lift(entry: Node):
     entry.prev.next = entry.next
@@ -141,42 +174,194 @@ def unlift(entry: Node):
     entry.prev.next = entry
     entry.next.prev = entry
 
-def check_single(model: Model, history: List[Entry], compute_partial: bool, kill: threading.Event) -> Tuple[bool, List[List[int]]]:
+KILL_POLL_INTERVAL = 64
+
+# Search-order heuristics. At each step of the search, the candidates are
+# the calls that can be linearized next: those before the first remaining
+# return, in history order. A heuristic is a factory, given the model,
+# the (maybe memoized) step function of a state and a call node, and the
+# partition's entries; it returns a function reordering, or filtering,
+# the candidates for a state. None keeps history order.
+def history_order(model: Model, step, history: List[Entry]):
+    return None
+
+# the op that must return soonest is the most constrained, so try it first
+def earliest_return(model: Model, step, history: List[Entry]):
+    rank = {}
+    for i, elem in enumerate(history):
+        if elem.is_return:
+            rank[elem.id] = i
+    key = lambda node: rank[node.id]
+    return lambda candidates, state: sorted(candidates, key=key)
+
+# only the ops whose output fits the current state, reads (which leave it
+# unchanged) first, so a get is linearized before writes move the state
+# away from what it returned. Steps every candidate up front, so it is
+# best combined with a step memo.
+def fits_state(model: Model, step, history: List[Entry]):
+    equal = model.equal
+    def order(candidates, state):
+        reads = []
+        writes = []
+        for node in candidates:
+            ok, new_state = step(state, node)
+            if ok:
+                (reads if equal(new_state, state) else writes).append(node)
+        return reads + writes
+    return order
+
+HEURISTICS = {
+    "history": history_order,
+    "earliest_return": earliest_return,
+    "fits_state": fits_state,
+}
+# on wide KV histories fits_state takes 2-50x fewer steps than history
+# order, and is never much slower
+DEFAULT_HEURISTIC = "fits_state"
+
+def check_heuristic(heuristic: str):
+    if heuristic not in HEURISTICS:
+        raise ValueError(f"porcupine: unknown heuristic {heuristic!r}; expecting one of {sorted(HEURISTICS)}")
+
+# A bounded memo of step results, keyed by op and state, for searches that
+# meet the same state again and again through different orders. States
+# are verified with model.equal, so hash collisions cost a step, never a
+# wrong answer. When full, the oldest result is dropped.
+def memoized_step(model: Model, size: int):
+    memo = {}
+    hash_state = model.hash_state
+    equal = model.equal
+    raw = model.step
+
+    def step(state, node):
+        key = (node.id, hash_state(state))
+        hit = memo.get(key)
+        if hit is not None and equal(hit[0], state):
+            return hit[1]
+        result = raw(state, node.value, node.match.value)
+        if len(memo) >= size:
+            del memo[next(iter(memo))]
+        memo[key] = (state, result)
+        return result
+    return step
+
+# how far check_single got on one partition, for tuning checking budgets
+class Progress:
+    def __init__(self, partition: int = 0, ops: int = 0):
+        self.partition = partition
+        self.ops = ops
+        self.steps = 0  # search iterations, including backtracking
+        self.states = 0  # distinct (linearized, state) pairs, i.e. cache size
+        self.backtracks = 0
+        self.done = False  # False if the search was stopped before it finished
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return (f"Progress(partition={self.partition}, ops={self.ops}, steps={self.steps}, states={self.states}, "
+                f"backtracks={self.backtracks}, done={self.done}, elapsed={self.elapsed:.3f})")
+
+# returns whether history is linearizable. When kill is set the search
+# stops early and returns False with progress.done still False, so callers
+# must consult progress to tell "illegal" from "stopped".
+#
+# The search starts from `state`, model.init() by default. If finals is a
+# list, the search does not stop at the first linearization: it appends
+# (final state, linearization) for every distinct final state it can
+# reach, stopping early once there are more than max_finals of them.
+#
+# bitset is the set representation used for the linearized ops; see
+# porcupine.bitset.
+def check_single(model: Model, history: List[Entry], compute_partial: bool, kill: threading.Event, bitset=IntBitSet, progress: Progress = None,
+                 state: Any = None, finals: List[Tuple[Any, List[int]]] = None, max_finals: int = 0,
+                 heuristic: str = DEFAULT_HEURISTIC, memo: int = 0) -> Tuple[bool, List[List[int]]]:
+    t0 = time.monotonic()
+    if progress is None:
+        progress = Progress()
+    check_heuristic(heuristic)
+    if memo:
+        step = memoized_step(model, memo)
+    else:
+        model_step = model.step
+        step = lambda state, node: model_step(state, node.value, node.match.value)
+    order = HEURISTICS[heuristic](model, step, history)
     entry = make_linked_entries(history)
     n = length(entry) // 2
-    linearized = BitSet(n)
-    cache = {}  # map from hash to cache entry
+    progress.ops = n
+    linearized = bitset(n)
+    zkeys = zobrist_keys(n)
+    zhash = 0  # Zobrist hash of linearized
+    hash_state = model.hash_state
+    cache = {}  # map from hash of (linearized, state) to cache entries
     calls = []
     longest = [None] * n  # longest linearizable prefix that includes the given entry
 
-    state = model.init()
+    def finish(done):
+        progress.steps = steps
+        progress.states = states
+        progress.backtracks = backtracks
+        progress.done = done
+        progress.elapsed = time.monotonic() - t0
+
+    if state is None:
+        state = model.init()
     head_entry = insert_before(Node(None, None, -1), entry)
-    while head_entry.next:
-        if kill.is_set():
-            return False, longest
-        if entry.match:
-            matching = entry.match  # the return entry
-            ok, new_state = model.step(state, entry.value, matching.value)
+
+    # the calls that can go next: those before the first remaining return
+    def next_candidates(state):
+        candidates = []
+        node = head_entry.next
+        while node is not None and node.match is not None:
+            candidates.append(node)
+            node = node.next
+        return candidates if order is None else order(candidates, state)
+
+    candidates = next_candidates(state)
+    i = 0
+    steps = 0
+    states = 0
+    backtracks = 0
+    while head_entry.next or finals is not None:
+        # kill may be a multiprocessing.Event, which is costly to poll
+        steps += 1
+        if steps % KILL_POLL_INTERVAL == 0:
+            if kill.is_set():
+                finish(False)
+                return False, longest
+            progress.steps = steps
+            progress.states = states
+        if i < len(candidates):
+            entry = candidates[i]
+            i += 1
+            ok, new_state = step(state, entry)
             if ok:
-                new_linearized = linearized.clone().set(entry.id)
-                new_cache_entry = CacheEntry(new_linearized, new_state)
-                if not cache_contains(model, cache, new_cache_entry):
-                    hash_value = new_linearized.hash()
-                    if hash_value not in cache:
-                        cache[hash_value] = []
-                    cache[hash_value].append(new_cache_entry)
-                    calls.append(CallsEntry(entry, state))
+                key = zhash ^ zkeys[entry.id] ^ hash_state(new_state)
+                bucket = cache.get(key)
+                if bucket is None or not cache_contains(model, bucket, linearized, entry.id, new_state):
+                    new_cache_entry = CacheEntry(linearized.clone().set(entry.id), new_state)
+                    if bucket is None:
+                        cache[key] = [new_cache_entry]
+                    else:
+                        bucket.append(new_cache_entry)
+                    states += 1
+                    calls.append(CallsEntry(entry, state, candidates, i))
                     state = new_state
                     linearized.set(entry.id)
+                    zhash ^= zkeys[entry.id]
                     lift(entry)
-                    entry = head_entry.next
-                else:
-                    entry = entry.next
-            else:
-                entry = entry.next
+                    candidates = next_candidates(state)
+                    i = 0
         else:
+            if head_entry.next is None:
+                # every op is linearized; note where we ended up, then
+                # backtrack to look for other final states
+                if not any(model.equal(state, f) for f, _ in finals):
+                    finals.append((state, [v.entry.id for v in calls]))
+                    if len(finals) > max_finals:
+                        finish(True)
+                        return True, longest
             if not calls:
-                return False, longest
+                finish(True)
+                return bool(finals), longest
             # longest
             if compute_partial:
                 calls_len = len(calls)
@@ -187,18 +372,150 @@ def check_single(model: Model, history: List[Entry], compute_partial: bool, kill
                         if seq is None:
                             seq = [v.entry.id for v in calls]
                         longest[v.entry.id] = seq
+            backtracks += 1
             calls_top = calls.pop()
             entry = calls_top.entry
             state = calls_top.state
+            candidates = calls_top.candidates
+            i = calls_top.next
             linearized.clear(entry.id)
+            zhash ^= zkeys[entry.id]
             unlift(entry)
-            entry = entry.next
     # longest linearization is the complete linearization, which is calls
     seq = [v.entry.id for v in calls]
     for i in range(n):
         longest[i] = seq
+    finish(True)
     return True, longest
 
+# Quiescent points are where every call so far has returned, so every op
+# before one precedes every op after it. A linearization of the history is
+# then a linearization of each segment between them, in order, with each
+# segment starting in a state the previous one can end in.
+def split_quiescent(history: List[Entry]) -> List[List[Entry]]:
+    segments = []
+    start = 0
+    open_calls = 0
+    for i, elem in enumerate(history):
+        open_calls += -1 if elem.is_return else 1
+        if open_calls == 0:
+            segments.append(history[start:i + 1])
+            start = i + 1
+    if start < len(history):
+        segments.append(history[start:])
+    return segments
+
+# number a segment's ops from 0, as check_single expects; returns the
+# entries and the original id of each op.
+def renumber_entries(segment: List[Entry]) -> Tuple[List[Entry], List[int]]:
+    m = {}
+    ids = []
+    entries = []
+    for elem in segment:
+        if elem.id not in m:
+            m[elem.id] = len(ids)
+            ids.append(elem.id)
+        entries.append(Entry(elem.is_return, elem.value, m[elem.id], elem.time, elem.client_id))
+    return entries, ids
+
+# Segments that can end in more distinct states than this, like many
+# concurrent appends, are checked as part of a single search instead.
+MAX_FRONTIER = 32
+
+# The frontier is the set of states a history can end in, each with a
+# linearization reaching it, kept as a chain of per-segment pieces
+# (op ids, parent) so that extending it does not copy it. Returns the
+# frontier after segment, which comes after the history, stopping early
+# once it has more than limit states; or None if kill was set first.
+def advance_frontier(model: Model, frontier: List[Tuple[Any, Any]], segment: List[Entry], kill: threading.Event, bitset=IntBitSet,
+                     progress: Progress = None, limit: int = MAX_FRONTIER, heuristic: str = DEFAULT_HEURISTIC, memo: int = 0) -> List[Tuple[Any, Any]]:
+    if progress is None:
+        progress = Progress()
+    next_frontier = []
+    if len(segment) == 2:
+        # a lone op, the common case in sequential histories: just step it
+        call, ret = segment
+        piece = [call.id]
+        for start, chain in frontier:
+            progress.steps += 1
+            ok, new_state = model.step(start, call.value, ret.value)
+            if ok and not any(model.equal(new_state, f) for f, _ in next_frontier):
+                next_frontier.append((new_state, (piece, chain)))
+                progress.states += 1
+                if len(next_frontier) > limit:
+                    break
+        return next_frontier
+    entries, ids = renumber_entries(segment)
+    for start, chain in frontier:
+        finals = []
+        p = Progress()
+        check_single(model, entries, False, kill, bitset, p, start, finals, limit, heuristic, memo)
+        progress.steps += p.steps
+        progress.states += p.states
+        progress.backtracks += p.backtracks
+        if not p.done:
+            return None
+        for f, seq in finals:
+            if not any(model.equal(f, g) for g, _ in next_frontier):
+                next_frontier.append((f, ([ids[i] for i in seq], chain)))
+        if len(next_frontier) > limit:
+            break
+    return next_frontier
+
+# the op ids of a frontier entry's linearization, in order
+def frontier_linearization(chain: Any) -> List[int]:
+    pieces = []
+    while chain is not None:
+        pieces.append(chain[0])
+        chain = chain[1]
+    return [i for piece in reversed(pieces) for i in piece]
+
+# check_single, but searching each quiescent segment on its own, carrying
+# forward the set of states the history so far can end in. The search
+# cache then only ever holds one segment's states, instead of a bitset
+# over the whole history per state, which grows quadratically. Falls back
+# to a single search when a segment has too many final states, and when
+# the history is illegal and partial linearizations were asked for, since
+# those need the whole-history search.
+def check_split(model: Model, history: List[Entry], compute_partial: bool, kill: threading.Event, bitset=IntBitSet, progress: Progress = None,
+                heuristic: str = DEFAULT_HEURISTIC, memo: int = 0) -> Tuple[bool, List[List[int]]]:
+    segments = split_quiescent(history)
+    if len(segments) <= 1:
+        return check_single(model, history, compute_partial, kill, bitset, progress, heuristic=heuristic, memo=memo)
+    t0 = time.monotonic()
+    if progress is None:
+        progress = Progress()
+    n = len(history) // 2
+    progress.ops = n
+    progress.steps = progress.states = progress.backtracks = 0
+
+    def stop(done):
+        progress.done = done
+        progress.elapsed = time.monotonic() - t0
+        return False, [None] * n
+
+    frontier = [(model.init(), None)]
+    polled = 0
+    for segment in segments:
+        if progress.steps - polled >= KILL_POLL_INTERVAL:
+            polled = progress.steps
+            if kill.is_set():
+                return stop(False)
+        frontier = advance_frontier(model, frontier, segment, kill, bitset, progress, heuristic=heuristic, memo=memo)
+        if frontier is None:
+            return stop(False)
+        if len(frontier) > MAX_FRONTIER:
+            return check_single(model, history, compute_partial, kill, bitset, progress, heuristic=heuristic, memo=memo)
+        if not frontier:
+            if compute_partial:
+                return check_single(model, history, compute_partial, kill, bitset, progress, heuristic=heuristic, memo=memo)
+            return stop(True)
+
+    seq = frontier_linearization(frontier[0][1])
+    progress.done = True
+    progress.elapsed = time.monotonic() - t0
+    return True, [seq] * n
+
 def fill_default(model: Model) -> Model:
     if model.partition is None:
         model.partition = no_partition
@@ -206,85 +523,236 @@ def fill_default(model: Model) -> Model:
         model.partition_event = no_partition_event
     if model.equal is None:
         model.equal = shallow_equal
+    if model.hash_state is None:
+        model.hash_state = default_hash_state
+    if model.partition_key is None:
+        model.partition_key = no_partition_key
+    if model.compact_states is None:
+        model.compact_states = no_compact_states
     if model.describe_operation is None:
         model.describe_operation = default_describe_operation
     if model.describe_state is None:
         model.describe_state = default_describe_state
     return model
 
-def check_parallel(model: Model, history: List[List[Entry]], compute_info: bool, timeout: float) -> Tuple[str, LinearizationInfo]:
-    ok = True
-    timed_out = False
-    results = []
+# set in each worker process of the "process" backend
+process_kill = None
+
+# Callers such as the test harness run labrpc and client threads, and
+# forking a threaded process can leave a lock held in the child forever.
+# So worker processes come from a forkserver, itself started clean, or
+# are spawned where there is none.
+def process_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def init_process_worker(kill):
+    global process_kill
+    process_kill = kill
+
+def check_partition(i: int, model: Model, subhistory: List[Entry], compute_info: bool, heuristic: str, memo: int):
+    progress = Progress(i)
+    single_ok, l = check_split(model, subhistory, compute_info, process_kill, progress=progress, heuristic=heuristic, memo=memo)
+    return i, single_ok, l, progress
+
+# backend "thread" checks each partition in its own thread. "process"
+# spreads partitions, largest first, over a pool of `workers` processes
+# (default: one per core), so pure-Python search is not serialized by the
+# GIL; models must then be picklable, i.e. built from module-level
+# functions.
+#
+# At the deadline every worker is told to stop; the call returns soon
+# after with "Unknown", unless a partition already proved the history
+# "Illegal". info.progress says how far each partition got.
+#
+# heuristic names the search order (see HEURISTICS) and memo, if not 0,
+# the size of each search's step memo (see memoized_step).
+def check_parallel(model: Model, history: List[List[Entry]], compute_info: bool, timeout: float, backend: str = "thread", workers: int = None,
+                   heuristic: str = DEFAULT_HEURISTIC, memo: int = 0) -> Tuple[str, LinearizationInfo]:
+    check_heuristic(heuristic)
     longest = [None] * len(history)
-    kill = threading.Event()
-
-    def worker(i: int, subhistory: List[Entry]):
-        nonlocal ok
-        single_ok, l = check_single(model, subhistory, compute_info, kill)
-        longest[i] = l
-        results.append(single_ok)
-        if not single_ok and not compute_info:
+    progress = [Progress(i, len(h) // 2) for i, h in enumerate(history)]
+    illegal = False
+
+    if backend == "process":
+        ctx = process_context()
+        kill = ctx.Event()
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(max_workers=min(workers, max(len(history), 1)), mp_context=ctx,
+                                   initializer=init_process_worker, initargs=(kill,))
+        # a worker's exception (an unpicklable model, a step that raises)
+        # comes out of f.result(); stop the others before it propagates
+        try:
+            order = sorted(range(len(history)), key=lambda i: len(history[i]), reverse=True)
+            futures = [pool.submit(check_partition, i, model, history[i], compute_info, heuristic, memo) for i in order]
+            deadline = time.monotonic() + timeout if timeout > 0 else None
+
+            pending = set(futures)
+            try:
+                for f in as_completed(futures, timeout=None if deadline is None else max(deadline - time.monotonic(), 0)):
+                    pending.discard(f)
+                    i, single_ok, l, p = f.result()
+                    longest[i] = l
+                    progress[i] = p
+                    if not single_ok and p.done:
+                        illegal = True
+                        if not compute_info:
+                            # one illegal partition decides the whole history
+                            break
+            except FuturesTimeoutError:
+                pass
             kill.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            # collect how far the stopped partitions got
+            for f in pending:
+                try:
+                    i, single_ok, l, p = f.result()
+                except CancelledError:
+                    continue
+                longest[i] = l
+                progress[i] = p
+                illegal = illegal or (not single_ok and p.done)
+        finally:
+            kill.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+    elif backend == "thread":
+        kill = threading.Event()
+
+        def worker(i: int, subhistory: List[Entry]):
+            nonlocal illegal
+            single_ok, l = check_split(model, subhistory, compute_info, kill, progress=progress[i], heuristic=heuristic, memo=memo)
+            longest[i] = l
+            if not single_ok and progress[i].done:
+                illegal = True
+                if not compute_info:
+                    kill.set()
+
+        threads = [threading.Thread(target=worker, args=(i, subhistory), daemon=True) for i, subhistory in enumerate(history)]
+        for t in threads:
+            t.start()
 
-    threads = [threading.Thread(target=worker, args=(i, subhistory)) for i, subhistory in enumerate(history)]
-    for t in threads:
-        t.start()
-
-    if timeout > 0:
-        timeout_event = threading.Event()
-        timeout_thread = threading.Thread(target=lambda: (time.sleep(timeout), timeout_event.set()))
-        timeout_thread.start()
-
-    for t in threads:
-        t.join()
-
-    if timeout_event.is_set():
-        timed_out = True
-
-    if compute_info:
-        # make sure we've waited for all threads to finish,
-        # otherwise we might race on access to longest[]
+        deadline = time.monotonic() + timeout if timeout > 0 else None
         for t in threads:
-            t.join()
+            t.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+            if t.is_alive():
+                # out of time: ask everyone to stop, then wait for them to
+                # notice, which takes at most KILL_POLL_INTERVAL steps
+                kill.set()
+                t.join()
+    else:
+        raise ValueError(f"porcupine: unknown backend {backend!r}; expecting 'thread' or 'process'")
 
+    if compute_info:
         # return longest linearizable prefixes that include each history element
         partial_linearizations = []
         for sub_longest in longest:
             partials = []
             seen = set()
-            for v in sub_longest:
-                if tuple(v) not in seen:
+            for v in sub_longest or []:
+                if v is not None and tuple(v) not in seen:
                     seen.add(tuple(v))
                     partials.append(v)
             partial_linearizations.append(partials)
 
-        info = LinearizationInfo(history, partial_linearizations)
+        info = LinearizationInfo(history, partial_linearizations, progress)
     else:
         info = None
 
-    if not ok:
+    if illegal:
         result = "Illegal"
-    elif timed_out:
+    elif not all(p.done for p in progress):
         result = "Unknown"
     else:
         result = "Ok"
 
     return result, info
 
-def check_events(model: Model, history: List[Event], verbose: bool, timeout: float) -> Tuple[str, LinearizationInfo]:
+# A check builds millions of objects that all live until it ends: the
+# history's entries, on top of the history itself. Every burst of
+# allocation makes the cyclic collector rescan them all, only to find that
+# none is garbage; on large histories that was half the preprocessing
+# time and more of the search's. So collection is paused while the
+# entries are built, and the search, whose cache is also long-lived,
+# collects young objects less often.
+#
+# That is process-wide collector state, which every other thread shares,
+# so check_operations and check_events only tune it when called with
+# quiet_gc=True; otherwise QuietGC(False) leaves the collector alone.
+# Concurrent checks count themselves in under _gc_mu: the first one in
+# saves the collector's settings, collection stays paused until the last
+# one building entries calls built(), and the last one out restores them.
+_gc_mu = threading.Lock()
+_gc_checks = 0  # checks inside a QuietGC
+_gc_building = 0  # of those, ones that have not called built()
+_gc_saved = None  # (enabled, threshold) before the first check came in
+
+class QuietGC:
+    def __init__(self, on: bool = True):
+        self.on = on
+        self.building = False
+
+    def __enter__(self):
+        global _gc_checks, _gc_building, _gc_saved
+        if not self.on:
+            return self
+        with _gc_mu:
+            if _gc_checks == 0:
+                _gc_saved = (gc.isenabled(), gc.get_threshold())
+                threshold = _gc_saved[1]
+                gc.set_threshold(max(threshold[0], 100000), *threshold[1:])
+            _gc_checks += 1
+            _gc_building += 1
+            self.building = True
+            gc.disable()
+        return self
+
+    # the entries are built; collection resumes once no other check is
+    # still building its own
+    def built(self):
+        global _gc_building
+        if not self.on:
+            return
+        with _gc_mu:
+            if not self.building:
+                return
+            self.building = False
+            _gc_building -= 1
+            if _gc_building == 0 and _gc_saved[0]:
+                gc.enable()
+
+    def __exit__(self, *exc):
+        global _gc_checks, _gc_saved
+        if not self.on:
+            return
+        self.built()
+        with _gc_mu:
+            _gc_checks -= 1
+            if _gc_checks == 0:
+                enabled, threshold = _gc_saved
+                _gc_saved = None
+                gc.set_threshold(*threshold)
+                if enabled:
+                    gc.enable()
+
+def check_events(model: Model, history: List[Event], verbose: bool, timeout: float, backend: str = "thread", workers: int = None,
+                 heuristic: str = DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> Tuple[str, LinearizationInfo]:
     model = fill_default(model)
-    partitions = model.partition_event(history)
-    l = []
-    for i in range(len(partitions)):
-        l.append(convert_entries(renumber(partitions[i])))
-    return check_parallel(model, l, verbose, timeout)
-
-def check_operations(model: Model, history: List[Operation], verbose: bool, timeout: float) -> Tuple[str, LinearizationInfo]:
+    with QuietGC(quiet_gc) as quiet:
+        partitions = model.partition_event(history)
+        l = []
+        for i in range(len(partitions)):
+            l.append(convert_entries(renumber(partitions[i])))
+        quiet.built()
+        return check_parallel(model, l, verbose, timeout, backend, workers, heuristic, memo)
+
+def check_operations(model: Model, history: List[Operation], verbose: bool, timeout: float, backend: str = "thread", workers: int = None,
+                     heuristic: str = DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> Tuple[str, LinearizationInfo]:
     model = fill_default(model)
-    partitions = model.partition(history)
-    l = []
-    for i in range(len(partitions)):
-        l.append(convert_entries(make_entries(partitions[i])))
-    return check_parallel(model, l, verbose, timeout)
+    with QuietGC(quiet_gc) as quiet:
+        partitions = model.partition(history)
+        l = []
+        for i in range(len(partitions)):
+            l.append(make_entries(partitions[i]))
+        quiet.built()
+        return check_parallel(model, l, verbose, timeout, backend, workers, heuristic, memo)
 
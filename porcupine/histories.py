@@ -0,0 +1,88 @@
+import random
+
+from porcupine.model import Operation
+from models.kv import KvInput, KvOutput
+
+# Synthetic KV histories, for the checker's tests and for its benchmarks
+# (porcupine_bench, perf_gate). Everything here is generated from a seed,
+# so a test or a benchmark checks exactly the same operations every run.
+# Tests depend on these exact outputs: changing a generator changes what
+# they check.
+
+# A KV history from nclients clients that each issue operations back to
+# back. Every operation takes effect at a random instant between its call
+# and its return, and outputs are computed by applying the operations in
+# that order, so the history is linearizable by construction. Larger
+# overlap makes operations longer relative to the gaps between them, and
+# so more concurrent.
+def kv_history(nops, nclients=4, nkeys=1, overlap=1.0, append_ratio=0.5, put_ratio=0.05, seed=0):
+    rng = random.Random(seed)
+    now = [0] * nclients
+    ops = []
+    for i in range(nops):
+        cli = i % nclients
+        call = now[cli] + rng.randint(1, 100)
+        ret = call + 1 + int(rng.randint(1, 100) * overlap * nclients)
+        now[cli] = ret
+        at = rng.uniform(call, ret)
+        key = str(rng.randrange(nkeys))
+        r = rng.random()
+        if r < put_ratio:
+            inp = KvInput(op=1, key=key, value=f"p {cli} {i} ")
+        elif r < put_ratio + append_ratio:
+            inp = KvInput(op=3, key=key, value=f"x {cli} {i} y")
+        else:
+            inp = KvInput(op=0, key=key)
+        ops.append((at, cli, inp, call, ret))
+
+    state = {}
+    history = []
+    for at, cli, inp, call, ret in sorted(ops, key=lambda o: o[0]):
+        old = state.get(inp.key, "")
+        if inp.op == 1:
+            state[inp.key] = inp.value
+            out = KvOutput()
+        elif inp.op == 3:
+            state[inp.key] = old + inp.value
+            out = KvOutput(value=old)
+        else:
+            out = KvOutput(value=old)
+        history.append(Operation(client_id=cli, input=inp, call_time=call, output=out, response_time=ret))
+    history.sort(key=lambda op: op.call_time)
+    return history
+
+def with_output(op, value):
+    return Operation(op.client_id, op.input, op.call_time, KvOutput(value=value), op.response_time)
+
+# one op from index start on (by default, from the second half) returns a
+# value nobody wrote
+def garbled(history, start=None):
+    bad = list(history)
+    for i in range(len(bad) // 2 if start is None else start, len(bad)):
+        if bad[i].input.op in (0, 3):
+            bad[i] = with_output(bad[i], bad[i].output.value + "!")
+            return bad
+    raise ValueError("no op with an output to garble")
+
+# one get from the second half returns "", though a write to its key
+# finished before it was called. Unlike a garbled value, "" is a state the
+# key really was in, so the checker has to search to rule it out.
+def stale(history):
+    bad = list(history)
+    written = {}  # key -> earliest return of a write
+    for op in history:
+        if op.input.op != 0:
+            written[op.input.key] = min(written.get(op.input.key, op.response_time), op.response_time)
+    for i in range(len(bad) // 2, len(bad)):
+        op = bad[i]
+        if op.input.op == 0 and op.output.value and written.get(op.input.key, op.call_time) < op.call_time:
+            bad[i] = with_output(op, "")
+            return bad
+    raise ValueError("no get to make stale")
+
+# n fully concurrent appends, then a get that no order explains; proving
+# that takes n! steps without a state cache
+def adversarial_history(n):
+    history = [Operation(i, KvInput(op=2, key="k", value=f"x{i}"), 0, KvOutput(), 100) for i in range(n)]
+    history.append(Operation(n, KvInput(op=0, key="k"), 200, KvOutput(value="!"), 300))
+    return history
@@ -1,6 +1,8 @@
 from typing import Any, Callable, List, Tuple
 
 class Operation:
+    __slots__ = ("client_id", "input", "call_time", "output", "response_time")
+
     def __init__(self, client_id: int, input: Any, call_time: int, output: Any, response_time: int):
         # Optional, unless you want a visualization; zero-indexed
         self.client_id = client_id
@@ -10,6 +12,8 @@ class Operation:
         self.response_time = response_time
 
 class Event:
+    __slots__ = ("client_id", "is_return", "value", "event_id")
+
     def __init__(self, client_id: int, is_return: bool, value: Any, event_id: int):
         # Optional, unless you want a visualization; zero-indexed
         self.client_id = client_id
@@ -24,7 +28,10 @@ class Model:
                        step: Callable[[Any, Any, Any], Tuple[bool, Any]] = None,
                        equal: Callable[[Any, Any], bool] = None,
                        describe_operation: Callable[[Any, Any], str] = None,
-                       describe_state: Callable[[Any], str] = None):
+                       describe_state: Callable[[Any], str] = None,
+                       hash_state: Callable[[Any], int] = None,
+                       partition_key: Callable[[Any], Any] = None,
+                       compact_states: Callable[[List[Any]], List[Any]] = None):
         # Partition functions, such that a history is linearizable if and only
         # if each partition is linearizable. If you don't want to implement
         # this, you can always use the `no_partition` functions implemented
@@ -46,6 +53,21 @@ class Model:
         # For visualization purposes, describe a state as a string.
         # For example, "{'x' -> 'y', 'z' -> 'w'}"
         self.describe_state = describe_state
+        # Hash on states, consistent with `equal`; the checker combines it
+        # with the hash of the linearized set to index its cache.
+        # `default_hash_state` works for any hashable state.
+        self.hash_state = hash_state
+        # For checking a history as it happens, which partition an op with
+        # the given input belongs to, consistent with `partition`. Use
+        # `no_partition_key` for a single partition.
+        self.partition_key = partition_key
+        # For checking a history as it happens, equivalent states that no
+        # longer reference the states they were reached from, so those can
+        # be freed once the ops that led to them are forgotten. Given all the
+        # states a partition might be in, so the new states can share
+        # structure, and equal states come back equal. States that never
+        # share structure can use `no_compact_states`.
+        self.compact_states = compact_states
 
 def no_partition(history: List[Operation]) -> List[List[Operation]]:
     return [history]
@@ -53,9 +75,22 @@ def no_partition(history: List[Operation]) -> List[List[Operation]]:
 def no_partition_event(history: List[Event]) -> List[List[Event]]:
     return [history]
 
+def no_partition_key(input: Any) -> Any:
+    return None
+
+def no_compact_states(states: List[Any]) -> List[Any]:
+    return states
+
 def shallow_equal(state1: Any, state2: Any) -> bool:
     return state1 == state2
 
+def default_hash_state(state: Any) -> int:
+    try:
+        return hash(state)
+    except TypeError:
+        # unhashable: every state shares a bucket, and equal() decides
+        return 0
+
 def default_describe_operation(input: Any, output: Any) -> str:
     return f"{input} -> {output}"
 
@@ -0,0 +1,178 @@
+import queue
+import threading
+from typing import Any, Callable, List
+
+from porcupine.model import Model, Operation
+from porcupine import checker
+from porcupine.checker import Entry, Progress, MAX_FRONTIER
+
+# Checks a history while it is being made. Each op is reported twice: by
+# invoke(), just before it is issued, and by complete(), once it returns.
+# Within a partition, whenever no op is outstanding, the ops since the
+# last such point form a segment that no later op can overlap. A
+# background thread checks each segment against the states the partition
+# could be in so far, then forgets it. Memory only holds ops that can
+# still matter, and a violation is reported a segment after it happens,
+# not at the end of the run.
+#
+# Times are the order of invoke and complete calls, so the interval
+# recorded for an op always contains the real one.
+
+class Partition:
+    def __init__(self, model: Model):
+        self.events = []  # since the last quiescent point
+        self.open = 0  # ops invoked but not completed
+        # the rest is only touched by the checking thread
+        self.frontier = [(model.init(), None)]
+        self.held = []  # segments that could end in too many states, to check with the next one
+        self.failed = False
+
+class OnlineChecker:
+    # on_violation(key, ops) is called from the checking thread with the
+    # partition key and the ops of the first segment of that partition
+    # that cannot be linearized.
+    def __init__(self, model: Model, on_violation: Callable[[Any, List[Operation]], None] = None):
+        self.model = checker.fill_default(model)
+        self.on_violation = on_violation
+        self.mu = threading.Lock()
+        self.parts = {}  # partition key -> Partition
+        self.calls = {}  # id -> (key, Partition, client_id) of outstanding ops
+        self.next_id = 0
+        self.time = 0
+        self.todo = queue.Queue()
+        self.kill = threading.Event()
+        self.progress = Progress()
+        self.violation = None  # (key, ops) of the first violation
+        self.completed = 0
+        self.checked = 0  # ops checked and forgotten
+        self.stopped = False
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # returns the id to pass to complete()
+    def invoke(self, client_id: int, input: Any) -> int:
+        key = self.model.partition_key(input)
+        with self.mu:
+            if self.closed:
+                raise ValueError("porcupine: invoke after close")
+            part = self.parts.get(key)
+            if part is None:
+                part = self.parts[key] = Partition(self.model)
+            id = self.next_id
+            self.next_id += 1
+            part.events.append(Entry(False, input, id, self.time, client_id))
+            self.time += 1
+            part.open += 1
+            self.calls[id] = (key, part, client_id)
+            return id
+
+    def complete(self, id: int, output: Any):
+        with self.mu:
+            if self.closed:
+                return
+            key, part, client_id = self.calls.pop(id)
+            part.events.append(Entry(True, output, id, self.time, client_id))
+            self.time += 1
+            part.open -= 1
+            self.completed += 1
+            if part.open == 0:
+                self.todo.put((key, part, part.events, False))
+                part.events = []
+
+    def failed(self) -> bool:
+        return self.violation is not None
+
+    # completed ops not yet checked and forgotten
+    def pending(self) -> int:
+        return self.completed - self.checked
+
+    # Stops recording, waits up to timeout seconds (0: for as long as it
+    # takes) for everything to be checked, and returns "Ok", "Illegal" or
+    # "Unknown", like checker.check_operations. Ops that were invoked but
+    # never completed are left out, as they would be from an OpLog.
+    def close(self, timeout: float = 0) -> str:
+        with self.mu:
+            if not self.closed:
+                self.closed = True
+                for key, part in self.parts.items():
+                    events = [e for e in part.events if e.id not in self.calls]
+                    self.todo.put((key, part, events, True))
+                    part.events = []
+                self.calls.clear()
+                self.todo.put(None)
+        self.thread.join(timeout if timeout > 0 else None)
+        if self.thread.is_alive():
+            self.kill.set()
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.violation is not None:
+            return "Illegal"
+        if self.stopped:
+            return "Unknown"
+        return "Ok"
+
+    def run(self):
+        try:
+            while True:
+                item = self.todo.get()
+                if item is None:
+                    return
+                self.check(*item)
+        except Exception as e:
+            self.error = e
+
+    def check(self, key: Any, part: Partition, segment: List[Entry], final: bool):
+        if part.failed or self.stopped:
+            return
+        if part.held:
+            segment = part.held + segment
+            part.held = []
+        if not segment:
+            return
+        # at the end, one way through is all it takes
+        limit = 0 if final else MAX_FRONTIER
+        frontier = checker.advance_frontier(self.model, part.frontier, segment, self.kill, progress=self.progress, limit=limit)
+        if frontier is None:
+            self.stopped = True
+        elif not frontier:
+            part.failed = True
+            ops = entries_to_operations(segment)
+            with self.mu:
+                if self.violation is None:
+                    self.violation = (key, ops)
+            if self.on_violation:
+                self.on_violation(key, ops)
+        elif len(frontier) > limit and not final:
+            # too many ways this could have gone; let the next segment
+            # narrow them down
+            part.held = segment
+        else:
+            # forget how we got here, only where we might be
+            part.frontier = []
+            for state in self.model.compact_states([state for state, _ in frontier]):
+                if not any(self.model.equal(state, s) for s, _ in part.frontier):
+                    part.frontier.append((state, None))
+            self.checked += len(segment) // 2
+
+def entries_to_operations(entries: List[Entry]) -> List[Operation]:
+    calls = {}
+    ops = []
+    for e in entries:
+        if not e.is_return:
+            calls[e.id] = e
+        else:
+            call = calls.pop(e.id)
+            ops.append(Operation(call.client_id, call.value, call.time, e.value, e.time))
+    return ops
+
+# feeds a recorded history to an online checker, in time order
+def replay(online: OnlineChecker, history: List[Operation]):
+    ids = {}
+    for e in checker.make_entries(history):
+        if not e.is_return:
+            ids[e.id] = online.invoke(e.client_id, e.value)
+        else:
+            online.complete(ids.pop(e.id), e.value)
@@ -4,32 +4,37 @@ from typing import List, Tuple, Any
 from porcupine.model import Operation, Model, Event
 from porcupine import checker
 
-def check_operations(model: Model, history: List[Operation]) -> bool:
-    res, _ = checker.check_operations(model, history, False, 0)
-    return res == CheckResult.Ok
+# backend is "thread" or "process", heuristic a search order from
+# checker.HEURISTICS and memo a step memo size; see checker.check_parallel.
+# quiet_gc=True tunes the process's garbage collector for the length of
+# the check; see checker.QuietGC.
+
+def check_operations(model: Model, history: List[Operation], backend: str = "thread", workers: int = None, heuristic: str = checker.DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> bool:
+    res, _ = checker.check_operations(model, history, False, 0, backend, workers, heuristic, memo, quiet_gc)
+    return res == "Ok"
 
 # timeout = 0 means no timeout
 # if this operation times out, then a false positive is possible
-def check_operations_timeout(model: Model, history: List[Operation], timeout: float) -> str:
-    res, _ = checker.check_operations(model, history, False, timeout)
+def check_operations_timeout(model: Model, history: List[Operation], timeout: float, backend: str = "thread", workers: int = None, heuristic: str = checker.DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> str:
+    res, _ = checker.check_operations(model, history, False, timeout, backend, workers, heuristic, memo, quiet_gc)
     return res
 
 # timeout = 0 means no timeout
 # if this operation times out, then a false positive is possible
-def check_operations_verbose(model: Model, history: List[Operation], timeout: float) -> Tuple[str, checker.LinearizationInfo]:
-    return checker.check_operations(model, history, True, timeout)
+def check_operations_verbose(model: Model, history: List[Operation], timeout: float, backend: str = "thread", workers: int = None, heuristic: str = checker.DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> Tuple[str, checker.LinearizationInfo]:
+    return checker.check_operations(model, history, True, timeout, backend, workers, heuristic, memo, quiet_gc)
 
-def check_events(model: Model, history: List[Event]) -> bool:
-    res, _ = checker.check_events(model, history, False, 0)
+def check_events(model: Model, history: List[Event], backend: str = "thread", workers: int = None, heuristic: str = checker.DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> bool:
+    res, _ = checker.check_events(model, history, False, 0, backend, workers, heuristic, memo, quiet_gc)
     return res == "Ok"
 
 # timeout = 0 means no timeout
 # if this operation times out, then a false positive is possible
-def check_events_timeout(model: Model, history: List[Event], timeout: float) -> str:
-    res, _ = checker.check_events(model, history, False, timeout)
+def check_events_timeout(model: Model, history: List[Event], timeout: float, backend: str = "thread", workers: int = None, heuristic: str = checker.DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> str:
+    res, _ = checker.check_events(model, history, False, timeout, backend, workers, heuristic, memo, quiet_gc)
     return res
 
 # timeout = 0 means no timeout
 # if this operation times out, then a false positive is possible
-def check_events_verbose(model: Model, history: List[Event], timeout: float) -> Tuple[str, checker.LinearizationInfo]:
-    return checker.check_events(model, history, True, timeout)
+def check_events_verbose(model: Model, history: List[Event], timeout: float, backend: str = "thread", workers: int = None, heuristic: str = checker.DEFAULT_HEURISTIC, memo: int = 0, quiet_gc: bool = False) -> Tuple[str, checker.LinearizationInfo]:
+    return checker.check_events(model, history, True, timeout, backend, workers, heuristic, memo, quiet_gc)
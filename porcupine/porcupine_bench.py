@@ -0,0 +1,257 @@
+import argparse
+import gc
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+from porcupine import checker
+from porcupine.online import OnlineChecker, replay
+from porcupine.bitset import BitSet, IntBitSet
+from porcupine.histories import kv_history, garbled, stale, adversarial_history
+from models.kv import KvModel
+
+# Benchmarks for the linearizability checker. Run from the repository
+# root:
+#
+#   python -m porcupine.porcupine_bench
+#   python -m porcupine.porcupine_bench --memory --sizes 1000000
+#   python -m porcupine.porcupine_bench --suite --json suite.json
+#
+# Histories are synthetic and generated from a seed (see
+# porcupine.histories), so every run checks exactly the same operations.
+
+def check_partitions(history, bitset):
+    model = checker.fill_default(KvModel)
+    kill = threading.Event()
+    ok = True
+    for p in model.partition(history):
+        entries = checker.make_entries(p)
+        single_ok, _ = checker.check_single(model, entries, False, kill, bitset)
+        ok = ok and single_ok
+    return ok
+
+def bench_bitsets(sizes, repeat=3, **kw):
+    rows = []
+    for n in sizes:
+        history = kv_history(n, **kw)
+        row = {"ops": n}
+        for bitset in (BitSet, IntBitSet):
+            best = None
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                ok = check_partitions(history, bitset)
+                dt = time.perf_counter() - t0
+                best = dt if best is None else min(best, dt)
+            assert ok, "generated history should be linearizable"
+            row[bitset.__name__] = best
+        row["speedup"] = row["BitSet"] / row["IntBitSet"]
+        rows.append(row)
+    return rows
+
+# bytes per operation held by a history and by each representation the
+# checker builds from it, measured with tracemalloc.
+def bench_memory(sizes, **kw):
+    rows = []
+    for n in sizes:
+        gc.collect()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        held = []
+        row = {"ops": n}
+        for stage, build in (
+            ("history", lambda: kv_history(n, **kw)),
+            ("make_entries", lambda: checker.make_entries(held[0])),
+            ("make_linked_entries", lambda: checker.make_linked_entries(held[1])),
+        ):
+            held.append(build())
+            gc.collect()
+            now = tracemalloc.get_traced_memory()[0]
+            row[stage] = (now - base) / n
+            base = now
+        tracemalloc.stop()
+        row["total"] = sum(row[k] for k in row if k != "ops")
+        rows.append(row)
+        del held
+    return rows
+
+MEMORY_STAGES = ["history", "make_entries", "make_linked_entries", "total"]
+
+# The suite: every checker mode on every scenario, each legal and made
+# illegal in each of the ways below.
+
+SCENARIOS = {
+    "narrow": dict(nclients=4, overlap=1.0),
+    "wide": dict(nclients=12, overlap=3.0),
+    "many_keys": dict(nclients=8, nkeys=64, overlap=2.0),
+    "get_heavy": dict(nclients=8, overlap=2.0, append_ratio=0.1),
+    "append_heavy": dict(nclients=8, overlap=2.0, append_ratio=0.9),
+    "quiescent": dict(nclients=4, overlap=0.1),
+}
+
+# mode -> (how, heuristic, memo)
+MODES = {
+    "history": ("single", "history", 0),
+    "earliest_return": ("single", "earliest_return", 0),
+    "fits_state": ("single", "fits_state", 0),
+    "memo": ("single", "fits_state", 1024),
+    "split": ("split", checker.DEFAULT_HEURISTIC, 0),
+    "online": ("online", checker.DEFAULT_HEURISTIC, 0),
+}
+
+HISTORY_KINDS = {
+    "legal": lambda h: h,
+    "garbled": garbled,
+    "stale": stale,
+}
+
+# checks history in the given mode, stopping after timeout seconds (0:
+# never); returns "Ok", "Illegal" or "Unknown", and the search totals
+# over all partitions.
+def run_mode(mode, history, timeout=0):
+    how, heuristic, memo = MODES[mode]
+    model = checker.fill_default(KvModel)
+    total = checker.Progress(0, len(history))
+    if how == "online":
+        online = OnlineChecker(model)
+        replay(online, history)
+        res = online.close(timeout)
+        p = online.progress
+        total.steps, total.states, total.backtracks = p.steps, p.states, p.backtracks
+        return res, total
+
+    kill = threading.Event()
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill.set)
+        timer.start()
+    try:
+        # tune the collector as the kvhistory CLI has check_operations do
+        with checker.QuietGC() as quiet:
+            parts = [checker.make_entries(part) for part in model.partition(history)]
+            quiet.built()
+            res = search(how, model, parts, kill, heuristic, memo, total)
+    finally:
+        if timer:
+            timer.cancel()
+    return res, total
+
+# checks each partition's entries in turn, adding up the search totals;
+# returns "Ok", "Illegal" or "Unknown"
+def search(how, model, parts, kill, heuristic, memo, total):
+    for i, entries in enumerate(parts):
+        p = checker.Progress(i)
+        if how == "split":
+            ok, _ = checker.check_split(model, entries, False, kill, progress=p, heuristic=heuristic, memo=memo)
+        else:
+            ok, _ = checker.check_single(model, entries, False, kill, progress=p, heuristic=heuristic, memo=memo)
+        total.steps += p.steps
+        total.states += p.states
+        total.backtracks += p.backtracks
+        if not p.done:
+            return "Unknown"
+        if not ok:
+            return "Illegal"
+    return "Ok"
+
+# best time of repeat runs, then one more under tracemalloc for the peak
+# memory the check itself allocates.
+def measure_mode(mode, history, repeat=3, timeout=0):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        res, total = run_mode(mode, history, timeout)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        run_mode(mode, history, timeout)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return {
+        "result": res,
+        "seconds": best,
+        "peak_bytes": peak,
+        "steps": total.steps,
+        "states": total.states,
+        "backtracks": total.backtracks,
+    }
+
+# every (scenario, size, kind, mode) combination, plus the adversarial
+# history at each of adversarial sizes; each row is a flat dict, ready for
+# JSON. Generated histories are linearizable, so "legal" rows should say
+# "Ok" and the others "Illegal", unless the timeout cut them short.
+def bench_suite(sizes=(1000,), scenarios=None, kinds=None, modes=None, repeat=3, timeout=0, seed=0, adversarial=(6, 8)):
+    scenarios = scenarios or list(SCENARIOS)
+    kinds = kinds or list(HISTORY_KINDS)
+    modes = modes or list(MODES)
+    cases = []
+    for scenario in scenarios:
+        for n in sizes:
+            history = kv_history(n, seed=seed, **SCENARIOS[scenario])
+            for kind in kinds:
+                cases.append((scenario, kind, HISTORY_KINDS[kind](history)))
+    for n in adversarial:
+        cases.append(("adversarial", "garbled", adversarial_history(n)))
+    rows = []
+    for scenario, kind, history in cases:
+        for mode in modes:
+            row = {"scenario": scenario, "kind": kind, "ops": len(history), "mode": mode}
+            row.update(measure_mode(mode, history, repeat, timeout))
+            rows.append(row)
+    return rows
+
+def print_suite(rows, out=sys.stdout):
+    print(f"{'scenario':<13} {'kind':<8} {'ops':>7} {'mode':<16} {'result':<8} {'seconds':>9} "
+          f"{'peak KiB':>9} {'steps':>9} {'states':>9} {'backtracks':>10}", file=out)
+    for r in rows:
+        print(f"{r['scenario']:<13} {r['kind']:<8} {r['ops']:>7} {r['mode']:<16} {r['result']:<8} {r['seconds']:>9.4f} "
+              f"{r['peak_bytes'] / 1024:>9.0f} {r['steps']:>9} {r['states']:>9} {r['backtracks']:>10}", file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description="porcupine checker benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None, help="operations per history (default: 1000 4000 16000; 1000 for --suite)")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--overlap", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="measure memory per operation instead")
+    parser.add_argument("--suite", action="store_true", help="run every checker mode on every scenario instead")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=None, help="suite scenarios (default: all)")
+    parser.add_argument("--kinds", nargs="+", choices=list(HISTORY_KINDS), default=None, help="suite history kinds (default: all)")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=None, help="suite checker modes (default: all)")
+    parser.add_argument("--adversarial", type=int, nargs="*", default=[6, 8], help="concurrent appends in each adversarial history")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds per suite check; 0 for no limit")
+    parser.add_argument("--json", metavar="FILE", help="also write suite results as JSON")
+    args = parser.parse_args()
+
+    if args.suite:
+        rows = bench_suite(args.sizes or [1000], args.scenarios, args.kinds, args.modes, args.repeat, args.timeout, args.seed, args.adversarial)
+        print_suite(rows)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(rows, f, indent=2)
+        return
+
+    sizes = args.sizes or [1000, 4000, 16000]
+    if args.memory:
+        rows = bench_memory(sizes, nclients=args.clients, overlap=args.overlap, seed=args.seed)
+        print("memory per operation (bytes)")
+        print(f"{'ops':>8}" + "".join(f"{s:>20}" for s in MEMORY_STAGES))
+        for r in rows:
+            print(f"{r['ops']:>8}" + "".join(f"{r[s]:>20.1f}" for s in MEMORY_STAGES))
+        return
+
+    rows = bench_bitsets(sizes, args.repeat, nclients=args.clients, overlap=args.overlap, seed=args.seed)
+    print("single-key history check time by bitset (seconds)")
+    print(f"{'ops':>8} {'BitSet':>10} {'IntBitSet':>10} {'speedup':>8}")
+    for r in rows:
+        print(f"{r['ops']:>8} {r['BitSet']:>10.4f} {r['IntBitSet']:>10.4f} {r['speedup']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import random
+import threading
+import time
+import unittest
+
+from porcupine.bitset import BitSet, IntBitSet
+from porcupine import checker
+from porcupine.model import Operation
+from porcupine.histories import kv_history, garbled, adversarial_history
+from models.kv import KvInput, KvOutput, KvModel
+
+def check_single(history, bitset=IntBitSet):
+    model = checker.fill_default(KvModel)
+    entries = checker.make_entries(history)
+    ok, _ = checker.check_single(model, entries, False, threading.Event(), bitset)
+    return ok
+
+class TestBitSet(unittest.TestCase):
+    def test_bitset(self):
+        rng = random.Random(1)
+        a = BitSet(300)
+        b = IntBitSet(300)
+        for _ in range(2000):
+            pos = rng.randrange(300)
+            if rng.random() < 0.6:
+                a.set(pos)
+                b.set(pos)
+            else:
+                a.clear(pos)
+                b.clear(pos)
+            self.assertEqual(a.get(pos), b.get(pos))
+            self.assertEqual(a.popcnt(), b.popcnt())
+
+        c = b.clone()
+        self.assertTrue(c.equals(b))
+        self.assertEqual(c.hash(), b.hash())
+        c.set(299) if not c.get(299) else c.clear(299)
+        self.assertFalse(c.equals(b), "clone should not share state")
+
+        for x in (a, b):
+            pos = next(p for p in range(300) if not x.get(p))
+            y = x.clone().set(pos)
+            self.assertTrue(y.equals_with(x, pos))
+            self.assertTrue(y.equals_with(y, pos))
+            self.assertFalse(x.equals_with(x, pos))
+
+class TestCheckSingle(unittest.TestCase):
+    def test_check_single(self):
+        history = kv_history(300, nclients=4, overlap=2.0, seed=3)
+        for bitset in (BitSet, IntBitSet):
+            self.assertTrue(check_single(history, bitset))
+
+        bad = garbled(history, 100)
+        for bitset in (BitSet, IntBitSet):
+            self.assertFalse(check_single(bad, bitset))
+
+class TestHeuristics(unittest.TestCase):
+    def test_agree(self):
+        model = checker.fill_default(KvModel)
+        for seed in range(4):
+            history = kv_history(300, nclients=6, overlap=2.0, seed=seed)
+            bad = garbled(history, 150)
+            for heuristic in checker.HEURISTICS:
+                for memo in (0, 64):
+                    for h, want in ((history, True), (bad, False)):
+                        entries = checker.make_entries(h)
+                        ok, longest = checker.check_single(model, entries, True, threading.Event(), heuristic=heuristic, memo=memo)
+                        self.assertEqual(ok, want, (seed, heuristic, memo))
+                        if ok:
+                            # the returned linearization replays
+                            state = model.init()
+                            for i in longest[0]:
+                                ok, state = model.step(state, h[i].input, h[i].output)
+                                self.assertTrue(ok)
+
+    def test_unknown(self):
+        model = checker.fill_default(KvModel)
+        with self.assertRaises(ValueError):
+            checker.check_single(model, checker.make_entries(kv_history(10)), False, threading.Event(), heuristic="nope")
+        with self.assertRaises(ValueError):
+            checker.check_operations(KvModel, kv_history(10), False, 0, heuristic="nope")
+
+    def test_memo(self):
+        import copy
+        calls = []
+        model = checker.fill_default(copy.copy(KvModel))
+        raw = model.step
+        def counting(state, input, output):
+            calls.append(input)
+            return raw(state, input, output)
+        model.step = counting
+        # one client, so calls and returns alternate
+        node = checker.make_linked_entries(checker.make_entries(kv_history(4, nclients=1)))
+        a, b, c = node, node.next.next, node.next.next.next.next
+        step = checker.memoized_step(model, 2)
+        state = model.init()
+        self.assertEqual(step(state, a), step(state, a))
+        self.assertEqual(len(calls), 1)
+        # two more keys push the first out
+        step(state, b)
+        step(state, c)
+        step(state, a)
+        self.assertEqual(len(calls), 4)
+
+class TestBenchSuite(unittest.TestCase):
+    def test_suite(self):
+        from porcupine.porcupine_bench import bench_suite, MODES
+        rows = bench_suite([200], scenarios=["narrow", "many_keys"], repeat=1, timeout=30, adversarial=(4,))
+        self.assertEqual(len(rows), (2 * 3 + 1) * len(MODES))
+        for r in rows:
+            want = "Ok" if r["kind"] == "legal" else "Illegal"
+            self.assertEqual(r["result"], want, r)
+            self.assertGreater(r["steps"], 0, r)
+            self.assertGreater(r["peak_bytes"], 0, r)
+
+class TestZobrist(unittest.TestCase):
+    def test_unhashable_state(self):
+        # states the cache cannot hash still check correctly, through
+        # default_hash_state putting them all in one bucket
+        from porcupine.model import Model
+        def step(state, inp, out):
+            ok, new = KvModel.step(state[0], inp, out)
+            return ok, [new]
+        model = Model(partition=KvModel.partition, init=lambda: [KvModel.init()], step=step)
+        model = checker.fill_default(model)
+        history = kv_history(200, nclients=4, overlap=2.0, seed=7)
+        for h, want in ((history, True), (garbled(history, 50), False)):
+            entries = checker.make_entries(h)
+            ok, _ = checker.check_single(model, entries, False, threading.Event())
+            self.assertEqual(ok, want)
+
+    def test_keys(self):
+        keys = checker.zobrist_keys(64)
+        self.assertEqual(keys, checker.zobrist_keys(64))
+        self.assertEqual(len(set(keys)), 64)
+
+class TestKvState(unittest.TestCase):
+    def test_kv_state(self):
+        root = KvModel.init()
+        a = root.append("ab").append("c")
+        self.assertIs(a, root.append("ab").append("c"))
+        self.assertIs(a.put("x"), root.put("x"))
+        self.assertIs(root.append(""), root)
+        self.assertEqual(a.length, 3)
+
+        # same length, wrong contents, at either end or in the middle
+        for s in ("xbc", "abx", "axc", "abcd", None):
+            self.assertFalse(a.matches(s))
+        s = "".join(["a", "bc"])
+        self.assertTrue(a.matches(s))
+        self.assertIs(a.value, s, "a matching output should be reused, not copied")
+        self.assertEqual(str(a.append("d")), "abcd")
+
+        ok, st = KvModel.step(a, KvInput(op=3, key="k", value="d"), KvOutput(value="abc"))
+        self.assertTrue(ok)
+        self.assertIs(st, a.append("d"))
+        ok, _ = KvModel.step(st, KvInput(op=0, key="k"), KvOutput(value="abce"))
+        self.assertFalse(ok)
+
+class TestSplit(unittest.TestCase):
+    def test_split_quiescent(self):
+        # a and b overlap; c starts as b returns, so still overlaps; d is alone
+        history = [
+            Operation(0, KvInput(op=0, key="k"), 0, KvOutput(value=""), 10),
+            Operation(1, KvInput(op=0, key="k"), 5, KvOutput(value=""), 20),
+            Operation(0, KvInput(op=0, key="k"), 20, KvOutput(value=""), 30),
+            Operation(1, KvInput(op=0, key="k"), 31, KvOutput(value=""), 40),
+        ]
+        entries = checker.make_entries(history)
+        segments = checker.split_quiescent(entries)
+        self.assertEqual([sorted({e.id for e in seg}) for seg in segments], [[0, 1, 2], [3]])
+        renumbered, ids = checker.renumber_entries(segments[1])
+        self.assertEqual(ids, [3])
+        self.assertEqual({e.id for e in renumbered}, {0})
+
+    def test_check_split(self):
+        model = checker.fill_default(KvModel)
+        for seed in range(10):
+            for overlap in (0.1, 0.5):
+                history = kv_history(200, nclients=3, overlap=overlap, seed=seed)
+                entries = checker.make_entries(history)
+                self.assertGreater(len(checker.split_quiescent(entries)), 1)
+                ok, longest = checker.check_split(model, entries, True, threading.Event())
+                self.assertTrue(ok)
+                # the returned linearization replays
+                state = model.init()
+                for i in longest[0]:
+                    ok, state = model.step(state, history[i].input, history[i].output)
+                    self.assertTrue(ok)
+
+                bad = checker.make_entries(garbled(history, 100))
+                ok, _ = checker.check_split(model, bad, False, threading.Event())
+                self.assertFalse(ok)
+
+class TestQuietGC(unittest.TestCase):
+    def test_restores(self):
+        import gc
+        threshold = gc.get_threshold()
+        frozen = gc.get_freeze_count()
+        outer = checker.QuietGC()
+        with outer:
+            self.assertFalse(gc.isenabled())
+            with checker.QuietGC() as inner:
+                inner.built()
+                # outer is still building
+                self.assertFalse(gc.isenabled())
+            outer.built()
+            self.assertTrue(gc.isenabled())
+            self.assertGreater(gc.get_threshold()[0], threshold[0])
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(gc.get_threshold(), threshold)
+        self.assertEqual(gc.get_freeze_count(), frozen)
+
+    def test_overlapping(self):
+        import gc
+        from porcupine.porcupine import check_operations
+        threshold = gc.get_threshold()
+        history = kv_history(3000, nclients=4, nkeys=3, overlap=1.0, seed=2)
+        bad = garbled(history)
+        start = threading.Barrier(4)
+        results = {}
+        def run(i, h):
+            start.wait()
+            for _ in range(3):
+                results.setdefault(i, []).append(check_operations(KvModel, h, quiet_gc=True))
+        threads = [threading.Thread(target=run, args=(i, bad if i % 2 else history)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, {i: [not i % 2] * 3 for i in range(4)})
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(gc.get_threshold(), threshold)
+
+    def test_opt_in(self):
+        import gc
+        from unittest import mock
+        from porcupine.porcupine import check_operations
+        history = kv_history(200, nclients=4, overlap=1.0, seed=2)
+        for quiet_gc in (False, True):
+            with mock.patch("gc.disable", wraps=gc.disable) as disable:
+                self.assertTrue(check_operations(KvModel, history, quiet_gc=quiet_gc))
+            self.assertEqual(disable.called, quiet_gc)
+            self.assertTrue(gc.isenabled())
+
+class TestOnline(unittest.TestCase):
+    def test_online(self):
+        from porcupine.online import OnlineChecker, replay
+        history = kv_history(2000, nclients=4, nkeys=3, overlap=0.5, seed=11)
+        online = OnlineChecker(KvModel)
+        replay(online, history)
+        # an op that never returns is left out
+        online.invoke(0, KvInput(op=0, key="0"))
+        self.assertEqual(online.close(), "Ok")
+        self.assertEqual(online.checked, 2000)
+        self.assertEqual(online.pending(), 0)
+
+    def test_violation(self):
+        from porcupine.online import OnlineChecker, replay
+        history = kv_history(2000, nclients=4, nkeys=3, overlap=0.5, seed=11)
+        reported = threading.Event()
+        found = []
+        def on_violation(key, ops):
+            found.append((key, ops))
+            reported.set()
+        online = OnlineChecker(KvModel, on_violation)
+        replay(online, garbled(history, 500))
+        # reported while the checker is still open for more ops
+        self.assertTrue(reported.wait(5))
+        self.assertTrue(online.failed())
+        self.assertEqual(online.close(), "Illegal")
+        key, ops = found[0]
+        self.assertTrue(any(op.output.value and op.output.value.endswith("!") for op in ops))
+        self.assertTrue(all(op.input.key == key for op in ops))
+
+    def test_memory(self):
+        import gc
+        import tracemalloc
+        from porcupine.online import OnlineChecker
+        # one key, appended to and read back op after op: without
+        # compaction every value ever read stays reachable from the
+        # frontier, and memory grows with the square of the stream
+        def retained(n):
+            online = OnlineChecker(KvModel)
+            self.addCleanup(online.close)
+            tracemalloc.start()
+            value = ""
+            for i in range(n):
+                online.complete(online.invoke(0, KvInput(op=2, key="k", value=str(i % 10))), KvOutput())
+                value += str(i % 10)
+                online.complete(online.invoke(0, KvInput(op=0, key="k")), KvOutput(value=value))
+            deadline = time.monotonic() + 10
+            while online.pending() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(online.pending(), 0)
+            gc.collect()
+            mem, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return mem
+        small, large = retained(1000), retained(4000)
+        self.assertLess(large, 100 * 1024)
+        self.assertLess(large, 4 * small + 64 * 1024)
+
+    def test_frontier_merges(self):
+        from porcupine.online import OnlineChecker
+        # two concurrent blind appends leave two possible states; a put
+        # from either reaches the same one
+        online = OnlineChecker(KvModel)
+        self.addCleanup(online.close)
+        def drain():
+            deadline = time.monotonic() + 10
+            while online.pending() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(online.pending(), 0)
+            return len(online.parts["k"].frontier)
+        for _ in range(50):
+            a = online.invoke(0, KvInput(op=2, key="k", value="a"))
+            b = online.invoke(1, KvInput(op=2, key="k", value="b"))
+            online.complete(a, KvOutput())
+            online.complete(b, KvOutput())
+            self.assertEqual(drain(), 2)
+            online.complete(online.invoke(0, KvInput(op=1, key="k", value="z")), KvOutput())
+            self.assertEqual(drain(), 1)
+            online.complete(online.invoke(1, KvInput(op=0, key="k")), KvOutput(value="z"))
+        self.assertLess(online.progress.steps, 2000)
+        self.assertEqual(online.close(), "Ok")
+
+    def test_timeout(self):
+        from porcupine.online import OnlineChecker, replay
+        online = OnlineChecker(KvModel)
+        replay(online, adversarial_history(14))
+        t0 = time.monotonic()
+        self.assertEqual(online.close(0.5), "Unknown")
+        self.assertLess(time.monotonic() - t0, 2.0)
+
+class TestCheckOperations(unittest.TestCase):
+    def test_backends(self):
+        from porcupine.porcupine import check_operations, check_operations_verbose
+        history = kv_history(600, nclients=6, nkeys=5, overlap=1.5, seed=5)
+        bad = garbled(history, 300)
+        for backend in ("thread", "process"):
+            self.assertTrue(check_operations(KvModel, history, backend))
+            self.assertFalse(check_operations(KvModel, bad, backend))
+
+            res, info = check_operations_verbose(KvModel, bad, 0, backend, workers=2)
+            self.assertEqual(res, "Illegal")
+            self.assertEqual(len(info.partial_linearizations), 5)
+
+        with self.assertRaises(ValueError):
+            check_operations(KvModel, history, "fibers")
+
+    def test_worker_error(self):
+        import copy
+        import multiprocessing
+        from porcupine.porcupine import check_operations
+        model = copy.copy(KvModel)
+        model.step = failing_step
+        # one partition fails at once while the other has a search that
+        # would run for ages
+        history = adversarial_history(14)
+        history.append(Operation(0, KvInput(op=0, key="boom"), 0, KvOutput(value=""), 1))
+        with self.assertRaisesRegex(RuntimeError, "step failed"):
+            check_operations(model, history, "process", workers=2)
+        # the other worker was stopped, not left searching
+        deadline = time.monotonic() + 5
+        while multiprocessing.active_children() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_events(self):
+        from porcupine.porcupine import check_events
+        from porcupine.model import Event
+        def events(history):
+            return [Event(e.client_id, e.is_return, e.value, e.id) for e in checker.make_entries(history)]
+        history = kv_history(300, nclients=4, overlap=1.0, seed=9)
+        self.assertTrue(check_events(KvModel, events(history)))
+        self.assertFalse(check_events(KvModel, events(garbled(history, 100))))
+
+# module level, so the process backend can pickle a model using it
+def failing_step(state, input, output):
+    if input.key == "boom":
+        raise RuntimeError("step failed")
+    return KvModel.step(state, input, output)
+
+class TestTimeout(unittest.TestCase):
+    def test_timeout(self):
+        from porcupine.porcupine import check_operations_verbose
+        history = adversarial_history(14)
+        for backend in ("thread", "process"):
+            t0 = time.monotonic()
+            res, info = check_operations_verbose(KvModel, history, 0.5, backend)
+            elapsed = time.monotonic() - t0
+            self.assertEqual(res, "Unknown")
+            self.assertLess(elapsed, 2.0, f"{backend} backend ignored the deadline")
+            p = info.progress[0]
+            self.assertFalse(p.done)
+            self.assertGreater(p.steps, 0)
+            self.assertEqual(p.ops, 15)
+
+        res, info = check_operations_verbose(KvModel, adversarial_history(4), 5)
+        self.assertEqual(res, "Illegal")
+        self.assertTrue(info.progress[0].done)
+        self.assertGreater(info.progress[0].backtracks, 0)
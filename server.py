@@ -2,6 +2,9 @@ import logging
 import threading
 from typing import Tuple, Any
 
+from labgob import labgob
+from labgob.compress import Compressor
+
 debugging = False
 
 def debug(format, *args):
@@ -30,6 +33,12 @@ class GetReply:
     def __init__(self, value):
         self.value = value
 
+# compact wire formats for the KV RPC messages; see labgob.schema.
+labgob.register_schema(1, PutAppendArgs, [("key", "str"), ("value", "str"), ("client_id", "int"), ("seq_num", "int"), ("op", "str")])
+labgob.register_schema(2, PutAppendReply, [("value", "str")])
+labgob.register_schema(3, GetArgs, [("key", "str"), ("client_id", "int"), ("seq_num", "int")])
+labgob.register_schema(4, GetReply, [("value", "str")])
+
 class KVServer:
     def __init__(self, cfg):
         self.mu = threading.Lock()
@@ -39,6 +48,8 @@ class KVServer:
         self.nservers = getattr(cfg, "nservers", 1)
         self.nreplicas = getattr(cfg, "nreplicas", 1)
         self.server_id = self._find_server_id()
+        # values of at least this many bytes are kept zlib-compressed; 0 = never
+        self.store = Compressor(getattr(cfg, "compress_values", 0))
 
     def _find_server_id(self):
         """Find this server's ID in the configuration"""
@@ -66,6 +77,18 @@ class KVServer:
         
         return False
 
+    def _load(self, key):
+        """Current value of key, decompressed if it is stored compressed"""
+        value = self.kv.get(key, "")
+        if isinstance(value, bytes):
+            return self.store.decompress(value).decode()
+        return value
+
+    def _save(self, key, value):
+        """Store value under key, compressed if it is large enough to pay off"""
+        z = self.store.compress(value.encode()) if self.store.threshold else None
+        self.kv[key] = value if z is None else z
+
     def _is_duplicate(self, client_id, seq_num):
         """Check if this request is a duplicate"""
         if client_id in self.last_ops:
@@ -90,7 +113,7 @@ class KVServer:
                 return cached_result
             
             # Get the value
-            value = self.kv.get(args.key, "")
+            value = self._load(args.key)
             reply = GetReply(value)
             
             # Record this request
@@ -110,7 +133,7 @@ class KVServer:
                 return cached_result
             
             # Put the value
-            self.kv[args.key] = args.value
+            self._save(args.key, args.value)
             reply = PutAppendReply("")
             
             # Record this request
@@ -130,8 +153,8 @@ class KVServer:
                 return cached_result
             
             # Get old value and append new value
-            old_value = self.kv.get(args.key, "")
-            self.kv[args.key] = old_value + args.value
+            old_value = self._load(args.key)
+            self._save(args.key, old_value + args.value)
             reply = PutAppendReply(old_value)  # Return the old value
             
             # Record this request
@@ -10,71 +10,100 @@ import base64
 
 from porcupine.model import Operation
 from porcupine.porcupine import check_operations_verbose
+from porcupine.online import OnlineChecker
 from models.kv import KvInput, KvOutput, KvModel
+from models.kvhistory import HistoryWriter
 from config import make_single_config, make_shard_config, Config
 
 linearizability_check_timeout = 1  # in seconds
 MiB = 1024 * 1024
 
+# Ops are kept in per-thread buffers, as (cli, input, output value, call
+# time, response time) tuples, so recording an op takes no lock and
+# builds no objects; read() merges the buffers into Operations.
 class OpLog:
-    def __init__(self):
-        self.operations = []
-        self.lock = threading.Lock()
-
-    def append(self, op: Operation):
-        with self.lock:
-            self.operations.append(op)
-
+    def __init__(self, online: OnlineChecker = None, record: HistoryWriter = None):
+        self.buffers = []  # one list per recording thread
+        self.local = threading.local()
+        self.lock = threading.Lock()  # guards buffers and record
+        # if set, ops are checked as they complete instead of kept
+        self.online = online
+        # if set, ops are also written to a file, to check again later
+        # with python -m models.kvhistory
+        self.record = record
+
+    # call before issuing an op; pass the result to append()
+    def invoke(self, cli: int, input: KvInput):
+        if self.online:
+            return self.online.invoke(cli, input)
+        return None
+
+    # value is the op's output value; call is what invoke() returned
+    def add(self, cli: int, input: KvInput, value, start: int, end: int, call=None):
+        # an online checker orders ops by when invoke() ran, which is too
+        # late to call once the op has completed
+        if self.online and call is None:
+            raise ValueError("OpLog: an online log needs the call that invoke() returned")
+        if self.record:
+            with self.lock:
+                self.record.write(Operation(cli, input, start, KvOutput(value=value), end))
+        if self.online:
+            self.online.complete(call, KvOutput(value=value))
+            return
+        try:
+            buf = self.local.buf
+        except AttributeError:
+            buf = self.local.buf = []
+            with self.lock:
+                self.buffers.append(buf)
+        buf.append((cli, input, value, start, end))
+
+    def append(self, op: Operation, call=None):
+        self.add(op.client_id, op.input, op.output.value, op.call_time, op.response_time, call)
+
+    # all ops recorded so far, by call time
     def read(self) -> List[Operation]:
         with self.lock:
-            return list(self.operations)
+            buffers = list(self.buffers)
+        ops = [Operation(cli, input, start, KvOutput(value=value), end)
+               for buf in buffers for cli, input, value, start, end in list(buf)]
+        ops.sort(key=lambda op: op.call_time)
+        return ops
 
 # to make sure timestamps use the monotonic clock, we measure time relative to t0
-t0 = time.monotonic()
+t0 = time.monotonic_ns()
 
 # get/put/putappend that keep counts
 def get(cfg, ck, key: str, log: OpLog, cli: int) -> str:
-    start = int((time.monotonic() - t0) * 1e9)
+    input = KvInput(op=0, key=key)
+    call = log.invoke(cli, input) if log else None
+    start = time.monotonic_ns() - t0
     v = ck.get(key)
-    end = int((time.monotonic() - t0) * 1e9)
+    end = time.monotonic_ns() - t0
     cfg.op()
     if log:
-        log.append(Operation(
-            input=KvInput(op=0, key=key),
-            output=KvOutput(value=v),
-            call_time=start,
-            response_time=end,
-            client_id=cli
-        ))
+        log.add(cli, input, v, start, end, call)
     return v
 
 def put(cfg, ck, key: str, value: str, log: OpLog, cli: int):
-    start = int((time.monotonic() - t0) * 1e9)
+    input = KvInput(op=1, key=key, value=value)
+    call = log.invoke(cli, input) if log else None
+    start = time.monotonic_ns() - t0
     ck.put(key, value)
-    end = int((time.monotonic() - t0) * 1e9)
+    end = time.monotonic_ns() - t0
     cfg.op()
     if log:
-        log.append(Operation(
-            input=KvInput(op=1, key=key, value=value),
-            output=KvOutput(),
-            call_time=start,
-            response_time=end,
-            client_id=cli
-        ))
+        log.add(cli, input, None, start, end, call)
 
 def append(cfg, ck, key: str, value: str, log: OpLog, cli: int) -> str:
-    start = int((time.monotonic() - t0) * 1e9)
+    input = KvInput(op=3, key=key, value=value)
+    call = log.invoke(cli, input) if log else None
+    start = time.monotonic_ns() - t0
     last = ck.append(key, value)
-    end = int((time.monotonic() - t0) * 1e9)
+    end = time.monotonic_ns() - t0
     cfg.op()
     if log:
-        log.append(Operation(
-            input=KvInput(op=3, key=key, value=value),
-            output=KvOutput(value=last),
-            call_time=start,
-            response_time=end,
-            client_id=cli
-        ))
+        log.add(cli, input, last, start, end, call)
     return last
 
 # a client runs the function f and then signals it is done
@@ -92,12 +121,17 @@ def run_client(t: unittest.TestCase, cfg, me: int, ca, fn):
 # spawn ncli clients and wait until they are all done
 def spawn_clients_and_wait(t: unittest.TestCase, cfg, ncli: int, fn):
     ca = [None] * ncli
-    for cli in range(ncli):
-        ca[cli] = queue.Queue()
-        threading.Thread(target=run_client, args=(t, cfg, cli, ca[cli], fn,)).start()
+    threads = [None] * ncli
+    # under LABRPC_SEED, clients take part in virtual time, so their
+    # calls overlap as they would in real time
+    with cfg.net.clock.participate():
+        for cli in range(ncli):
+            ca[cli] = queue.Queue()
+            threads[cli] = cfg.net.clock.go(run_client, t, cfg, cli, ca[cli], fn)
     print("spawn_clients_and_wait: waiting for clients")
     for cli in range(ncli):
         ok = ca[cli].get()
+        threads[cli].join()
         print(f"spawn_clients_and_wait: client {cli} is done")
         if not ok:
             t.fail("failure")
@@ -152,9 +186,12 @@ def rand_value(n: int) -> str:
 # operations to the server for some period of time.  After the period
 # is over, test checks that all appended values are present and in
 # order for a particular key.  If unreliable is set, RPCs may fail.
-def generic_test(t: unittest.TestCase, nclients: int, shards: Tuple[int, int], unreliable: bool, randomkeys: bool):
+# With online (default: PORCUPINE_ONLINE set in the environment), the
+# history is checked while the test runs, rather than all at the end. With
+# KV_HISTORY_DIR set, the history is also saved there, as <test id>.kvh.
+def generic_test(t: unittest.TestCase, nclients: int, shards: Tuple[int, int], unreliable: bool, randomkeys: bool, online: bool = None):
     NITER = 3
-    TIME = 1  # in seconds
+    TIME = 1  # wall-clock seconds, even under LABRPC_SEED; see Config
 
     title = "Test: "
     if unreliable:
@@ -167,14 +204,21 @@ def generic_test(t: unittest.TestCase, nclients: int, shards: Tuple[int, int], u
         title += "many clients"
     else:
         title += "one client"
+    if online is None:
+        online = bool(os.environ.get("PORCUPINE_ONLINE"))
+    if online:
+        title += ", online check"
 
     if shards[0] == 1:
         cfg = make_single_config(t, unreliable)
     else:
         cfg = make_shard_config(t, shards[0], shards[1], unreliable)
+    record = None
+    if os.environ.get("KV_HISTORY_DIR"):
+        record = HistoryWriter(os.path.join(os.environ["KV_HISTORY_DIR"], t.id() + ".kvh"))
     try:
         cfg.begin(title)
-        op_log = OpLog()
+        op_log = OpLog(OnlineChecker(KvModel) if online else None, record)
 
         ck = cfg.make_client()
 
@@ -241,13 +285,37 @@ def generic_test(t: unittest.TestCase, nclients: int, shards: Tuple[int, int], u
                 if not randomkeys:
                     check_clnt_appends(t, cli, v, j)
 
-        res, info = check_operations_verbose(KvModel, op_log.read(), linearizability_check_timeout)
+            if online and op_log.online.failed():
+                op_log.online.close()
+                t.fail(f"history is not linearizable: key {op_log.online.violation[0]!r}")
+
+        if record:
+            record.close()
+            print(f"info: history saved to {record.f.name}")
+
+        if online:
+            res = op_log.online.close(linearizability_check_timeout)
+            if res == "Illegal":
+                t.fail(f"history is not linearizable: key {op_log.online.violation[0]!r}")
+            elif res == "Unknown":
+                print("info: linearizability check timed out, assuming history is ok")
+                print(f"info:   {op_log.online.pending()} ops unchecked")
+            return
+
+        # the clients are done, so nothing else is allocating: let the
+        # checker pause the collector while it builds its entries
+        res, info = check_operations_verbose(KvModel, op_log.read(), linearizability_check_timeout, quiet_gc=True)
         if res == "Illegal":
             t.fail("history is not linearizable")
         elif res == "Unknown":
             print("info: linearizability check timed out, assuming history is ok")
+            for p in info.progress:
+                if not p.done:
+                    print(f"info:   {p}")
 
     finally:
+        if record:
+            record.close()
         cfg.cleanup()
         cfg.end()
 
@@ -261,6 +329,41 @@ class TestConcurrent(unittest.TestCase):
     def test_concurrent(self):
         generic_test(self, 5, (1, 1), False, False)
 
+# Test: many clients, random keys, history checked as the test runs
+class TestOnlineCheck(unittest.TestCase):
+    def test_online_check(self):
+        generic_test(self, 5, (1, 1), False, True, online=True)
+
+# Test: ops recorded from many threads at once all come back, in order
+class TestOpLog(unittest.TestCase):
+    def test_op_log(self):
+        log = OpLog()
+        def record(cli):
+            for j in range(1000):
+                log.add(cli, KvInput(op=0, key="k"), str(j), j * 8 + cli, j * 8 + cli + 1)
+        threads = [threading.Thread(target=record, args=(cli,)) for cli in range(8)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        ops = log.read()
+        self.assertEqual([op.call_time for op in ops], list(range(8000)))
+        self.assertEqual(ops[9].client_id, 1)
+        self.assertEqual(ops[9].output.value, "1")
+
+# Test: LABRPC_SEED turns on virtual time only when set to an integer
+class TestSeed(unittest.TestCase):
+    def test_seed(self):
+        from unittest import mock
+        from labrpc.clock import RealClock, VirtualClock
+        for seed, clock in (("", RealClock), ("7", VirtualClock)):
+            with mock.patch.dict(os.environ, LABRPC_SEED=seed):
+                cfg = Config(self)
+            cfg.cleanup()
+            self.assertIsInstance(cfg.net.clock, clock)
+        with mock.patch.dict(os.environ, LABRPC_SEED="seven"), self.assertRaisesRegex(ValueError, "LABRPC_SEED"):
+            Config(self)
+
 # Test: unreliable net, many clients
 class TestUnreliable(unittest.TestCase):
     def test_unreliable(self):
@@ -426,6 +529,38 @@ class TestRejection(unittest.TestCase):
 
         print("  ... Passed")
 
+# Test: large values are stored compressed and read back intact
+class TestCompressedValues(unittest.TestCase):
+    def test_compressed_values(self):
+        cfg = Config(self)
+        cfg.compress_values = 1024
+        cfg.start_cluster(1)
+        try:
+            ck = cfg.make_client()
+            cfg.begin("Test: compressed values")
+
+            small = "s" * 100
+            big = "x 0 0 y" * 1000
+            put(cfg, ck, "a", small, None, -1)
+            put(cfg, ck, "b", big, None, -1)
+            last = append(cfg, ck, "b", "tail", None, -1)
+            if last != big:
+                self.fail("append returned the wrong old value")
+            check(self, ck, "a", small)
+            check(self, ck, "b", big + "tail")
+
+            kvserver = cfg.kvservers[0]
+            self.assertIsInstance(kvserver.kv["a"], str)
+            self.assertIsInstance(kvserver.kv["b"], bytes)
+            self.assertGreater(kvserver.store.stats()["ratio"], 10)
+            stats = cfg.store_stats()
+            self.assertEqual(stats["count"], 2)
+            self.assertGreater(stats["compress_secs"], 0)
+            self.assertGreater(stats["decompress_secs"], 0)
+        finally:
+            cfg.cleanup()
+            cfg.end()
+
 # Test: unreliable net, many clients
 class TestUnreliableShards(unittest.TestCase):
     def test_unreliable_shards(self):